@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from time import monotonic
+
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class ResultCache:
+    """
+    In-process cache for QUERY and SUGGEST results, with TTL and LRU eviction.
+    Share one instance between the search client and the ingest/control clients of the process: ingest commands
+    invalidate the buckets they touch and `trigger(Action.CONSOLIDATE)` invalidates everything.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0, clock: Callable[[], float] = monotonic):
+        """
+        :param max_size: maximum number of cached results, the least recently used result is evicted first
+        :param ttl: seconds a result is served from the cache
+        :param clock: time source, in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, Tuple[float, str, str, Tuple[bytes, ...]]]
+        self._buckets = {}  # type: Dict[Tuple[str, str], Set[Hashable]]
+        # invalidation generation, results fetched before an invalidation of their bucket are not stored
+        self._generation = 0
+        self._invalidated = {}  # type: Dict[Tuple[str, Optional[str]], int]
+        self._cleared = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self) -> int:
+        """
+        Current invalidation generation, to be passed to `set` for a result fetched from now on
+        """
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[List[bytes]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, _, _, value = entry
+        if expires <= self.clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(value)
+
+    def set(self, key: Hashable, collection: str, bucket: str, value: List[bytes], generation: int) -> None:
+        """
+        Store a result
+        :param key: result key
+        :param collection: collection of the result, used for invalidation
+        :param bucket: bucket of the result, used for invalidation
+        :param value: result
+        :param generation: `generation()` from before the command was sent
+        """
+        if generation < max(
+            self._cleared, self._invalidated.get((collection, None), 0), self._invalidated.get((collection, bucket), 0)
+        ):
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self.clock() + self.ttl, collection, bucket, tuple(value))
+        self._buckets.setdefault((collection, bucket), set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, collection: str = None, bucket: str = None) -> None:
+        """
+        Drop cached results
+        :param collection: collection to invalidate, everything if not set
+        :param bucket: bucket to invalidate, the whole collection if not set
+        """
+        self._generation += 1
+        self.invalidations += 1
+        if collection is None:
+            self._cleared = self._generation
+            self._entries.clear()
+            self._buckets.clear()
+            self._invalidated.clear()
+            return
+        self._invalidated[(collection, bucket)] = self._generation
+        if bucket is None:
+            keys = [key for key in self._buckets if key[0] == collection]
+        else:
+            keys = [(collection, bucket)]
+        for key in keys:
+            for entry in self._buckets.pop(key, ()):
+                del self._entries[entry]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, collection, bucket, _ = self._entries.pop(key)
+        keys = self._buckets.get((collection, bucket))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._buckets[(collection, bucket)]
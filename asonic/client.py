@@ -1,12 +1,29 @@
+import asyncio
 from collections import deque
-import sys
-from typing import List, Dict, Optional
-
-from asonic.connection import ConnectionPool
-from asonic.enums import Action, Channel, Command, all_commands, enabled_commands
-from asonic.exceptions import ClientError
+from itertools import chain, islice, zip_longest
+from time import monotonic
+from typing import (
+    Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence,
+    Tuple, Union
+)
+
+from asonic.cache import ResultCache
+from asonic.codec import BYTES, RESULT_TYPES, Item, encode, parse_event, parse_info, parse_result
+from asonic.connection import Connection, ConnectionPool, current_priority, with_timeout
+from asonic.consolidate import Consolidator
+from asonic.enums import Action, Channel, Command, Priority, all_commands, enabled_commands, event_commands
+from asonic.exceptions import ClientError, ServerError, Timeout
+from asonic.journal import OPS as JOURNALED, Journal, read
+from asonic.limiter import AdaptiveLimiter
+from asonic.metrics import Metrics
+from asonic.preprocess import Preprocessor
+from asonic.protocol import ProtocolConnection
+from asonic.suggest import SuggestCache
 
 BUFFER = 20000
+# connection implementation of each `transport`
+TRANSPORTS = {'stream': Connection, 'protocol': ProtocolConnection}
+
 
 def escape(t):
     if t is None:
@@ -14,21 +31,243 @@ def escape(t):
     return '"' + t.replace('"', '\\"').replace('\r\n', ' ') + '"'
 
 
+def push_overhead(collection: str, bucket: str, obj: str, locale: str = None) -> int:
+    """
+    Bytes of a PUSH command line besides its text, the whole line has to fit in the buffer of the server
+    """
+    return len(f'{Command.PUSH.value} {collection} {bucket} {obj} "" LANG({locale or ""})\r\n'.encode())
+
+
+def chunk_text(text: str, size: int) -> Iterator[str]:
+    """
+    Split text into chunks that take at most `size` bytes on the wire once UTF-8 encoded and escaped.
+    Chunks are cut at the last whitespace that fits, or at a character boundary for words longer than `size`
+    :param text: text to be split
+    :param size: maximum escaped size of a chunk in bytes
+    """
+    if size < 4:
+        raise ClientError(f'Chunk size {size} is too small')
+    data = text.strip().encode()
+    total = len(data)
+    start = 0
+    while start < total:
+        end = min(start + size, total)
+        # every quote is escaped with a backslash, shrink until the escaped slice fits: dropping a byte saves one or
+        # two, dropping half of the excess never goes below the largest slice that fits
+        excess = end - start + data.count(b'"', start, end) - size
+        while excess > 0:
+            end -= max(excess // 2, 1)
+            excess = end - start + data.count(b'"', start, end) - size
+        if end < total:
+            cut = max(data.rfind(b' ', start, end + 1), data.rfind(b'\n', start, end + 1))
+            if cut > start:
+                end = cut
+            else:
+                # no whitespace, don't cut inside a multi-byte character
+                while data[end] & 0xC0 == 0x80:
+                    end -= 1
+        if end <= start:
+            # always move forward, by one character at least
+            end = start + 1
+            while end < total and data[end] & 0xC0 == 0x80:
+                end += 1
+        chunk = data[start:end].decode().strip()
+        if chunk:
+            yield chunk
+        start = end
+        while start < total and data[start] in b' \t\r\n':
+            start += 1
+
+
+Records = Union[Iterable[Tuple], AsyncIterable[Tuple]]
+
+
+async def _aiter(records: Records) -> AsyncIterator[Tuple]:
+    if hasattr(records, '__aiter__'):
+        async for record in records:  # type: ignore
+            yield record
+    else:
+        for record in records:  # type: ignore
+            yield record
+
+
+async def run_many(
+    method: Callable[..., Awaitable], records: Records, concurrency: int
+) -> AsyncIterator[Tuple[Tuple, Any]]:
+    """
+    Call `method(*record)` for every record, at most `concurrency` at once, pulling records only when a slot is free.
+    Yields `(record, result)` in completion order, `result` is the exception raised for a failed record
+    """
+    pending = {}  # type: Dict[asyncio.Future, Tuple]
+
+    async def run(record: Tuple) -> Any:
+        return await method(*record)
+
+    async def completed() -> List[Tuple[Tuple, Any]]:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        return [(pending.pop(task), task.exception() or task.result()) for task in done]
+
+    try:
+        async for record in _aiter(records):
+            while len(pending) >= concurrency:
+                for outcome in await completed():
+                    yield outcome
+            pending[asyncio.ensure_future(run(record))] = record
+        while pending:
+            for outcome in await completed():
+                yield outcome
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def merge(results: Sequence[List[Item]], limit: int = None, offset: int = None) -> List[Item]:
+    """
+    Merge ranked results of several queries: interleave them by rank and drop duplicates
+    """
+    merged = list(dict.fromkeys(item for item in chain.from_iterable(zip_longest(*results)) if item is not None))
+    start = offset or 0
+    return merged[start:None if limit is None else start + limit]
+
+
+class _Flight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+def _retrieve(task: asyncio.Future) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+async def _paginate(
+    fetch: Callable[[int, int], Awaitable[List[Item]]], page_size: int, prefetch: int
+) -> AsyncIterator[Item]:
+    if page_size < 1 or prefetch < 0:
+        raise ClientError(f'Invalid page size {page_size} or prefetch {prefetch}')
+    pending = deque()  # type: Deque[asyncio.Future]
+    offset = 0
+
+    def request_page() -> None:
+        nonlocal offset
+        pending.append(asyncio.ensure_future(fetch(page_size, offset)))
+        offset += page_size
+
+    try:
+        for _ in range(prefetch + 1):
+            request_page()
+        while pending:
+            page = await pending.popleft()
+            last = len(page) < page_size
+            if last:
+                # the pages requested after a short page are empty
+                for task in pending:
+                    task.cancel()
+                pending.clear()
+            for item in page:
+                yield item
+            if not last:
+                # only `prefetch` pages are requested while one is consumed
+                request_page()
+    finally:
+        for task in pending:
+            if task.done():
+                _retrieve(task)  # it may have failed already
+            task.cancel()
+
+
 class Client:
     def __init__(
         self,
         host: str = 'localhost',
         port: int = 1491,
         password: str = 'SecretPassword',
-        max_connections: int = 100
+        max_connections: int = 100,
+        multiplex: bool = False,
+        max_in_flight: int = 16,
+        cache: ResultCache = None,
+        min_connections: int = 0,
+        idle_timeout: float = None,
+        metrics: Metrics = None,
+        connect_timeout: float = None,
+        command_timeout: float = None,
+        pool_timeout: float = None,
+        result_type: str = BYTES,
+        transport: str = 'stream',
+        limiter: AdaptiveLimiter = None,
+        preprocessor: Preprocessor = None,
+        suggest_cache: SuggestCache = None,
+        coalesce: bool = False,
+        consolidator: Consolidator = None,
+        journal: Journal = None,
+        priorities: Dict[Command, Priority] = None,
+        priority_caps: Dict[Priority, int] = None
     ):
+        """
+        :param multiplex: share connections between concurrent commands instead of holding one connection per
+        command; replies are routed back to callers by a reader task per connection (using `PENDING`/`EVENT` markers
+        for QUERY, SUGGEST and LIST), so many commands are in flight on a handful of connections
+        :param max_in_flight: with multiplex, number of pending commands on a connection before opening another one
+        :param cache: cache for QUERY and SUGGEST results; share it with the ingest and control clients of the process
+        so their commands invalidate it
+        :param min_connections: number of connections opened (in parallel) when the channel is set and kept open
+        :param idle_timeout: seconds after which an unused connection is closed (down to `min_connections`)
+        :param metrics: collects command latencies and errors, pool usage and bytes on the wire
+        :param connect_timeout: seconds to open and authenticate a connection
+        :param command_timeout: seconds to wait for the reply of a command, a connection that timed out is closed
+        :param pool_timeout: seconds to wait for a free connection from the pool
+        (`Timeout` is raised when any of them expire, no limit if not set)
+        :param result_type: type of the items returned by QUERY, SUGGEST and LIST: `bytes` or `str`
+        :param transport: `stream` (asyncio streams) or `protocol` (a raw `asyncio.Protocol`, less overhead per
+        command, see `asonic.protocol`)
+        :param limiter: caps the concurrent commands of the client and adapts the cap to the server latency and errors
+        :param preprocessor: text preprocessing applied by `push` and `push_many` before sending
+        :param suggest_cache: prefix trie answering narrowing SUGGEST locally; share it with the ingest and control
+        clients of the process so their commands invalidate it
+        :param coalesce: concurrent identical QUERY and SUGGEST share one request and its result (sent with the
+        timeout of the first caller); a caller cancelling only stops waiting, the request is cancelled with the last one
+        :param consolidator: counts the PUSH and POP of the client and triggers CONSOLIDATE in the background
+        :param journal: records every successful PUSH, POP and FLUSH of the client, see `replay`
+        :param priorities: priority class of commands when the pool is full, eg. `{Command.LIST: Priority.BULK}`;
+        `asonic.connection.use_priority` overrides it for a block of code (default: DEFAULT)
+        :param priority_caps: maximum connections used at once by a priority class
+        (priorities don't apply with multiplex, commands never wait for a connection)
+        """
+        if result_type not in RESULT_TYPES:
+            raise ClientError(f'Unknown result type {result_type}')
+        if transport not in TRANSPORTS:
+            raise ClientError(f'Unknown transport {transport}')
         self.host = host
         self.port = port
         self.password = password
         self.max_connections = max_connections
+        self.multiplex = multiplex
+        self.max_in_flight = max_in_flight
+        self.cache = cache
+        self.min_connections = min_connections
+        self.idle_timeout = idle_timeout
+        self.metrics = metrics
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.pool_timeout = pool_timeout
+        self.result_type = result_type
+        self.transport = transport
+        self.limiter = limiter
+        self.preprocessor = preprocessor
+        self.suggest_cache = suggest_cache
+        self.coalesce = coalesce
+        self.consolidator = consolidator
+        self.journal = journal
+        self.priorities = priorities or {}
+        self.priority_caps = priority_caps
+        self.coalesced = 0
 
         self._channel = Channel.UNINITIALIZED
         self.pool = None  # type: Optional[ConnectionPool]
+        self._flights = {}  # type: Dict[str, _Flight]
 
     @classmethod
     async def create(
@@ -37,13 +276,19 @@ class Client:
         port: int = 1491,
         password: str = 'SecretPassword',
         channel: Channel = Channel.SEARCH,
-        max_connections: int = 100
+        max_connections: int = 100,
+        **kwargs
     ):
+        """
+        Create a client and open its channel
+        :param kwargs: the other arguments of `Client` (multiplex, cache, timeouts, priorities, etc.)
+        """
         client: Client = Client(
             host=host,
             port=port,
             password=password,
-            max_connections=max_connections
+            max_connections=max_connections,
+            **kwargs
         )
         _ = await client.channel(channel=channel)
         return client
@@ -65,13 +310,38 @@ class Client:
             channel=channel,
             max_connections=self.max_connections,
             password=self.password,
+            max_in_flight=self.max_in_flight,
+            min_connections=self.min_connections,
+            idle_timeout=self.idle_timeout,
+            metrics=self.metrics,
+            connect_timeout=self.connect_timeout,
+            pool_timeout=self.pool_timeout,
+            connection_class=TRANSPORTS[self.transport],
+            priority_caps=self.priority_caps,
         )
+        await self.pool.fill(shared=self.multiplex)
         # force check if connection can be made
         _ = await self.ping()
 
+    async def close(self) -> None:
+        """
+        Close the connections of the client, its consolidator is closed first (the pending writes are consolidated)
+        """
+        if self.consolidator is not None:
+            await self.consolidator.close()
+        if self.pool is not None:
+            await self.pool.destroy()
+
     async def query(
-        self, collection: str, bucket: str, terms: str, limit: int = None, offset: int = None, locale: str = None
-    ) -> List[bytes]:
+        self,
+        collection: str,
+        bucket: str,
+        terms: str,
+        limit: int = None,
+        offset: int = None,
+        locale: str = None,
+        timeout: float = None
+    ) -> List[Item]:
         """
         query database
         time complexity: O(1) if enough exact word matches or O(N) if not enough exact matches where
@@ -83,18 +353,15 @@ class Client:
         :param offset: a positive integer number; set within allowed maximum & minimum limits
         :param locale: an ISO 639-3 locale code eg. `eng` for English
         (if set, the locale must be a valid ISO 639-3 code; if not set, the locale will be guessed from text)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-
-        response = await self._command(
-            Command.QUERY, collection, bucket, escape(terms), limit=limit, offset=offset, locale=locale
+        return await self._search(
+            Command.QUERY, collection, bucket, escape(terms), timeout=timeout, limit=limit, offset=offset, locale=locale
         )
-        tokens = response.split()
-        if len(tokens) == 3:
-            return []
-        else:
-            return tokens[3:]
 
-    async def suggest(self, collection: str, bucket: str, word: str, limit: int = None) -> List[bytes]:
+    async def suggest(
+        self, collection: str, bucket: str, word: str, limit: int = None, timeout: float = None
+    ) -> List[Item]:
         """
         auto-completes word
         time complexity: O(1)
@@ -102,20 +369,25 @@ class Client:
         :param bucket: index bucket name (ie. user-specific search classifier in the collection if you have any
         :param word: text for search term
         :param limit: a positive integer number; set within allowed maximum & minimum limits
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        response = await self._command(Command.SUGGEST, collection, bucket, escape(word), limit=limit)
-        tokens = response.split()
-        if len(tokens) == 3:
-            return []
-        else:
-            return tokens[3:]
-
-    async def ping(self) -> bytes:
+        if self.suggest_cache is None:
+            return await self._search(Command.SUGGEST, collection, bucket, escape(word), timeout=timeout, limit=limit)
+        words = self.suggest_cache.get(collection, bucket, word, limit, self.result_type)
+        if words is not None:
+            return words
+        generation = self.suggest_cache.generation()
+        words = await self._search(Command.SUGGEST, collection, bucket, escape(word), timeout=timeout, limit=limit)
+        self.suggest_cache.set(collection, bucket, word, limit, words, generation, self.result_type)
+        return words
+
+    async def ping(self, timeout: float = None) -> bytes:
         """
         ping server
         time complexity: O(1)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        return await self._command(Command.PING)
+        return await self._command(Command.PING, timeout=timeout)
 
     async def quit(self) -> bytes:
         """
@@ -124,29 +396,18 @@ class Client:
         """
         return await self._command(Command.QUIT)
 
-    async def help(self, manual: str) -> bytes:
+    async def help(self, manual: str, timeout: float = None) -> bytes:
         """
         show help
         time complexity: O(1)
         :param manual: help manual to be shown (available manuals: commands)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        return await self._command(Command.HELP, manual)
-
-    def _chunk_generator(self, text: str, buffer: int):
-        empty_string_size = sys.getsizeof(str())
-        chars = deque(text.strip())
-        chunk_size = empty_string_size
-        chunk = str()
-        while chars:
-            char = chars.popleft()
-            chunk += char
-            chunk_size += (sys.getsizeof(char) - empty_string_size)
-            if (not chars) or (chunk_size > (buffer-100)):
-                yield chunk
-                chunk_size = empty_string_size
-                chunk = str()
+        return await self._command(Command.HELP, manual, timeout=timeout)
 
-    async def push(self, collection: str, bucket: str, obj: str, text: str, locale: str = None) -> bytes:
+    async def push(
+        self, collection: str, bucket: str, obj: str, text: str, locale: str = None, timeout: float = None
+    ) -> bytes:
         """
         Push search data in the index
         time complexity: O(1)
@@ -159,12 +420,54 @@ class Client:
         limits)
         :param locale: an ISO 639-3 locale code eg. `eng` for English
         (if set, the locale must be a valid ISO 639-3 code; if not set, the locale will be guessed from text)
+        :param timeout: seconds to push the whole text (default: command_timeout for each chunk)
         """
-        for text_chunk in self._chunk_generator(text, BUFFER):
-            result = await self._command(Command.PUSH, collection, bucket, obj, escape(text_chunk), locale=locale)
+        if self.preprocessor is not None:
+            text = self.preprocessor(text)
+        return await self._push(collection, bucket, obj, text, locale, timeout)
+
+    async def _push(
+        self, collection: str, bucket: str, obj: str, text: str, locale: str = None, timeout: float = None
+    ) -> bytes:
+        assert self.pool is not None
+        size = (self.pool.buffer or BUFFER) - push_overhead(collection, bucket, obj, locale)
+        chunks = [escape(text_chunk) for text_chunk in chunk_text(text, size)]
+        return await self.push_chunks(collection, bucket, obj, chunks, locale, timeout)
+
+    async def push_chunks(
+        self, collection: str, bucket: str, obj: str, chunks: List[str], locale: str = None, timeout: float = None
+    ) -> bytes:
+        """
+        Push text already split and escaped (eg. prepared in other processes), see `push`
+        :param chunks: escaped text chunks, each one has to fit in the buffer of the server with the rest of the PUSH
+        :param locale: an ISO 639-3 locale code eg. `eng` for English
+        :param timeout: seconds to push every chunk (default: command_timeout for each chunk)
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(deadline - loop.time(), 0)
+
+        if self.multiplex:
+            # pipeline every chunk instead of waiting for each reply
+            results = await asyncio.gather(*(
+                self._command(Command.PUSH, collection, bucket, obj, chunk, timeout=remaining(), locale=locale)
+                for chunk in chunks
+            ))
+            if not results:
+                raise ClientError(f'Nothing to push for {obj}')
+            return results[-1]
+        result = None
+        for chunk in chunks:
+            result = await self._command(
+                Command.PUSH, collection, bucket, obj, chunk, timeout=remaining(), locale=locale
+            )
+        if result is None:
+            raise ClientError(f'Nothing to push for {obj}')
         return result
 
-    async def pop(self, collection: str, bucket: str, obj: str, text: str) -> int:
+    async def pop(self, collection: str, bucket: str, obj: str, text: str, timeout: float = None) -> int:
         """
         Pop search data from the index
         time complexity: O(1)
@@ -173,31 +476,44 @@ class Client:
         :param obj: object identifier that refers to an entity in an external database, where the searched object
         is stored (eg. you use Sonic to index CRM contacts by name; full CRM contact data is stored in a MySQL database
         in this case the object identifier in Sonic will be the MySQL primary key for the CRM contact)
-        :param text: search text to be indexed (can be a single word, or a longer text; within maximum length safety
-        limits)
+        :param text: search text to be removed from the index (can be a single word, or a longer text, split like in
+        `push`)
+        :param timeout: seconds to wait for the reply (default: command_timeout for each chunk)
         """
-        result = await self._command(Command.POP, collection, bucket, obj, escape(text))
-        return int(result[7:])
-
-    async def flushc(self, collection: str) -> int:
+        assert self.pool is not None
+        overhead = f'{Command.POP.value} {collection} {bucket} {obj} ""\r\n'
+        size = (self.pool.buffer or BUFFER) - len(overhead.encode())
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        popped = 0
+        for text_chunk in chunk_text(text, size):
+            remaining = None if deadline is None else max(deadline - loop.time(), 0)
+            popped += parse_result(
+                await self._command(Command.POP, collection, bucket, obj, escape(text_chunk), timeout=remaining)
+            )
+        return popped
+
+    async def flushc(self, collection: str, timeout: float = None) -> int:
         """
         Flush all indexed data from a collection
         time complexity: O(1)
         :param collection: index collection (ie. what you search in, eg. messages, products, etc.)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        return int((await self._command(Command.FLUSHC, collection))[7:])
+        return parse_result(await self._command(Command.FLUSHC, collection, timeout=timeout))
 
-    async def flushb(self, collection: str, bucket: str) -> int:
+    async def flushb(self, collection: str, bucket: str, timeout: float = None) -> int:
         """
         Flush all indexed data from a bucket in a collection
         time complexity: O(1)
         :param collection: index collection (ie. what you search in, eg. messages, products, etc.)
         :param bucket: index bucket name (ie. user-specific search classifier in the collection if you have any
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
 
-        return int((await self._command(Command.FLUSHB, collection, bucket))[7:])
+        return parse_result(await self._command(Command.FLUSHB, collection, bucket, timeout=timeout))
 
-    async def flusho(self, collection: str, bucket: str, obj: str) -> int:
+    async def flusho(self, collection: str, bucket: str, obj: str, timeout: float = None) -> int:
         """
         Flush all indexed data from an object in a bucket in collection
         time complexity: O(1)
@@ -206,11 +522,77 @@ class Client:
         :param obj: object identifier that refers to an entity in an external database, where the searched object
         is stored (eg. you use Sonic to index CRM contacts by name; full CRM contact data is stored in a MySQL database
         in this case the object identifier in Sonic will be the MySQL primary key for the CRM contact)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
+        """
+
+        return parse_result(await self._command(Command.FLUSHO, collection, bucket, obj, timeout=timeout))
+
+    def push_many(self, records: Records, concurrency: int = None) -> AsyncIterator[Tuple[Tuple, Any]]:
+        """
+        Push many objects concurrently, see `push`
+        Records are pulled from `records` only when one of the `concurrency` slots is free, so a slow server slows
+        the producer down instead of buffering the whole dataset in memory.
+        Yields `(record, result)` in completion order, `result` is the exception raised for a failed record, the
+        other records are still pushed
+        :param records: iterable or async iterable of (collection, bucket, object, text[, locale]) tuples
+        :param concurrency: maximum number of records in flight (default: max_connections)
         """
+        if self.preprocessor is None:
+            return self._many(self.push, records, concurrency)
+        # preprocess by batches of the size of the window, the preprocessed texts are yielded
+        records = self.preprocessor.records(_aiter(records), concurrency or self.max_connections)
+        return self._many(self._push, records, concurrency)
 
-        return int((await self._command(Command.FLUSHO, collection, bucket, obj))[7:])
+    def pop_many(self, records: Records, concurrency: int = None) -> AsyncIterator[Tuple[Tuple, Any]]:
+        """
+        Pop many objects concurrently, see `push_many` and `pop`
+        :param records: iterable or async iterable of (collection, bucket, object, text) tuples
+        :param concurrency: maximum number of records in flight (default: max_connections)
+        """
+        return self._many(self.pop, records, concurrency)
+
+    def flusho_many(self, records: Records, concurrency: int = None) -> AsyncIterator[Tuple[Tuple, Any]]:
+        """
+        Flush many objects concurrently, see `push_many` and `flusho`
+        :param records: iterable or async iterable of (collection, bucket, object) tuples
+        :param concurrency: maximum number of records in flight (default: max_connections)
+        """
+        return self._many(self.flusho, records, concurrency)
 
-    async def count(self, collection: str, bucket: str = None, obj: str = None) -> int:
+    async def replay(self, path: str, concurrency: int = None) -> Dict[str, int]:
+        """
+        Send the records of a journal (see `asonic.journal`), eg. to rebuild a node, returns the number of commands
+        sent by command. Pushes are sent `concurrency` at once, a POP or FLUSH waits for the commands before it.
+        Stops at the first failed command
+        :param path: directory of the journal
+        :param concurrency: maximum number of pushes in flight (default: max_connections)
+        """
+        stats = {command.value: 0 for command in JOURNALED}
+        records = read(path)
+        barrier = []  # type: List[Tuple[Command, Tuple]]
+
+        def pushes() -> Iterator[Tuple]:
+            for command, fields in records:
+                if command != Command.PUSH:
+                    barrier.append((command, fields))
+                    return
+                yield fields
+
+        async def push(collection: str, bucket: str, obj: str, text: str, locale: Optional[str]) -> bytes:
+            return await self._command(Command.PUSH, collection, bucket, obj, text, locale=locale)
+
+        while True:
+            async for _, result in self._many(push, pushes(), concurrency):
+                if isinstance(result, Exception):
+                    raise result
+                stats[Command.PUSH.value] += 1
+            if not barrier:
+                return stats
+            command, fields = barrier.pop()
+            await self._command(command, *fields)
+            stats[command.value] += 1
+
+    async def count(self, collection: str, bucket: str = None, obj: str = None, timeout: float = None) -> int:
         """
         Count indexed search data
         time complexity: O(1)
@@ -219,62 +601,299 @@ class Client:
         :param obj: object identifier that refers to an entity in an external database, where the searched object
         is stored (eg. you use Sonic to index CRM contacts by name; full CRM contact data is stored in a MySQL database
         in this case the object identifier in Sonic will be the MySQL primary key for the CRM contact)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        result = await self._command(Command.COUNT, collection, bucket=bucket, object=obj)
-        return int(result[7:])
+        result = await self._command(Command.COUNT, collection, timeout=timeout, bucket=bucket, object=obj)
+        return parse_result(result)
 
-    async def trigger(self, action: Action = None) -> bytes:
+    async def trigger(self, action: Action = None, timeout: float = None) -> bytes:
         """
         Trigger an action
         time complexity: O(1)
         :param action: action to be triggered (available actions: consolidate)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        return await self._command(Command.TRIGGER, action=action.value if action else None)
+        return await self._command(Command.TRIGGER, timeout=timeout, action=action.value if action else None)
 
-    async def info(self) -> Dict:
+    async def info(self, timeout: float = None) -> Dict:
         """
         Get server information
         time complexity: O(1)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        res = await self._command(Command.INFO)
-        return dict(map(lambda x: x.replace('(', ' ').replace(')', '').split(), res[7:].decode().split()))
+        return parse_info(await self._command(Command.INFO, timeout=timeout))
 
-    async def list(self, collection: str, bucket: str = None, limit: int = None, offset: int = None) -> Dict:
+    async def list(
+        self, collection: str, bucket: str = None, limit: int = None, offset: int = None, timeout: float = None
+    ) -> Dict:
         """
         Enumerates all words in an index
         time complexity: O(1)
+        :param timeout: seconds to wait for the reply (default: command_timeout)
         """
-        response = await self._command(command=Command.LIST, collection=collection, bucket=bucket, limit=limit, offset=offset)
-        tokens = response.split()
-        if len(tokens) == 3:
-            return []
-        else:
-            return tokens[3:]
+        if self.suggest_cache is not None:
+            generation = self.suggest_cache.generation()
+        response = await self._command(
+            command=Command.LIST, collection=collection, bucket=bucket, limit=limit, offset=offset, timeout=timeout
+        )
+        words = parse_event(response, self.result_type)
+        if self.suggest_cache is not None and bucket is not None and not offset and limit is not None:
+            # every word of the bucket, suggestions for any prefix can be filtered from it
+            self.suggest_cache.set(collection, bucket, '', limit, words, generation, self.result_type)
+        return words
 
-    async def _command(self, command: Command, *args, **kwargs) -> bytes:
+    async def query_buckets(
+        self,
+        collection: str,
+        buckets: Iterable[str],
+        terms: str,
+        limit: int = None,
+        concurrency: int = None,
+        locale: str = None,
+        cancel_slow: bool = False,
+        timeout: float = None
+    ) -> List[Item]:
+        """
+        Query several buckets concurrently and merge their results: interleaved by rank (in the order of `buckets`
+        for equal ranks) without duplicates.
+        With `limit`, the first `limit` results are returned as soon as they are settled, without waiting for the
+        buckets that can't change them (eg. the buckets after the first `limit` ones when those all have results)
+        :param buckets: buckets to search in
+        :param limit: number of results, also requested from each bucket
+        :param concurrency: maximum number of buckets queried at once (default: max_connections)
+        :param cancel_slow: cancel the queries still running when the results are returned early, instead of letting
+        them complete in the background (eg. to fill the cache)
+        :param timeout: seconds to wait for the reply of each bucket (default: command_timeout)
+        """
+        buckets = list(buckets)
+        remaining = enumerate(buckets)
+        results = {}  # type: Dict[int, List[Item]]
+        pending = {}  # type: Dict[asyncio.Future, int]
+
+        def start(count: int) -> None:
+            for index, bucket in islice(remaining, count):
+                query = self.query(collection, bucket, terms, limit=limit, locale=locale, timeout=timeout)
+                pending[asyncio.ensure_future(query)] = index
+
+        def merged() -> List[Item]:
+            return merge([results[index] for index in sorted(results)], limit)
+
+        def settled() -> bool:
+            # walk the interleaved positions, the prefix is settled once it has `limit` results before the first
+            # position of a bucket that didn't answer yet
+            assert limit is not None
+            seen = set()
+            for rank in range(limit):
+                for index in range(len(buckets)):
+                    if index not in results:
+                        return False
+                    if rank < len(results[index]):
+                        seen.add(results[index][rank])
+                        if len(seen) >= limit:
+                            return True
+            return False
+
+        try:
+            start(concurrency or self.max_connections)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[pending.pop(task)] = task.result()
+                if limit is not None and settled():
+                    break
+                start(len(done))
+        except BaseException:
+            cancel_slow = True
+            raise
+        finally:
+            for task in pending:
+                if task.done():
+                    _retrieve(task)
+                elif cancel_slow:
+                    task.cancel()
+                else:
+                    task.add_done_callback(_retrieve)
+        return merged()
+
+    def iter_query(
+        self,
+        collection: str,
+        bucket: str,
+        terms: str,
+        page_size: int = 100,
+        prefetch: int = 1,
+        locale: str = None,
+        timeout: float = None
+    ) -> AsyncIterator[Item]:
+        """
+        Iterate over every result of a query, see `query`.
+        Results are fetched by pages of `page_size` (LIMIT/OFFSET) and the next `prefetch` pages are requested while
+        the current one is consumed, so at most `prefetch + 1` pages are held in memory
+        :param page_size: number of results per QUERY (Sonic caps it to its query_limit_maximum, 100 by default)
+        :param prefetch: number of pages requested ahead
+        :param timeout: seconds to wait for each page (default: command_timeout)
+        """
+        return _paginate(
+            lambda limit, offset: self.query(
+                collection, bucket, terms, limit=limit, offset=offset, locale=locale, timeout=timeout
+            ),
+            page_size,
+            prefetch
+        )
+
+    def iter_list(
+        self,
+        collection: str,
+        bucket: str = None,
+        page_size: int = 100,
+        prefetch: int = 1,
+        timeout: float = None
+    ) -> AsyncIterator[Item]:
+        """
+        Iterate over every word of an index, by pages, see `iter_query` and `list`
+        :param page_size: number of words per LIST
+        :param prefetch: number of pages requested ahead
+        :param timeout: seconds to wait for each page (default: command_timeout)
+        """
+        return _paginate(
+            lambda limit, offset: self.list(collection, bucket, limit=limit, offset=offset, timeout=timeout),
+            page_size,
+            prefetch
+        )
+
+    async def _search(
+        self, command: Command, collection: str, bucket: str, text: str, timeout: float = None, **kwargs
+    ) -> List[Item]:
+        key = (command, collection, bucket, text, tuple(kwargs.values()), self.result_type)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        def fetch() -> Awaitable[List[Item]]:
+            return self._fetch(key, command, collection, bucket, text, timeout, kwargs)
+
+        if self.coalesce:
+            return await self._single_flight(encode(command, (collection, bucket, text), kwargs), fetch)
+        return await fetch()
+
+    async def _fetch(
+        self, key: tuple, command: Command, collection: str, bucket: str, text: str, timeout: Optional[float],
+        kwargs: dict
+    ) -> List[Item]:
+        if self.cache is not None:
+            generation = self.cache.generation()
+
+        response = await self._command(command, collection, bucket, text, timeout=timeout, **kwargs)
+        result = parse_event(response, self.result_type)
+
+        if self.cache is not None:
+            self.cache.set(key, collection, bucket, result, generation)
+        return result
+
+    async def _single_flight(self, line: str, fetch: Callable[[], Awaitable[List[Item]]]) -> List[Item]:
+        flight = self._flights.get(line)
+        if flight is None:
+            flight = self._flights[line] = _Flight(asyncio.ensure_future(fetch()))
+            flight.task.add_done_callback(lambda task: self._land(line, flight))
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            # shielded, cancelling a caller must not cancel the request of the others
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # nobody waits for the reply anymore
+                self._land(line, flight)
+                flight.task.cancel()
+        # every caller gets its own list
+        return list(result)
+
+    def _land(self, line: str, flight: '_Flight') -> None:
+        if self._flights.get(line) is flight:
+            del self._flights[line]
+        if flight.task.done():
+            _retrieve(flight.task)
+
+    def _many(
+        self, method: Callable[..., Awaitable], records: Records, concurrency: Optional[int]
+    ) -> AsyncIterator[Tuple[Tuple, Any]]:
+        return run_many(method, records, concurrency or self.max_connections)
+
+    async def _command(self, command: Command, *args, timeout: float = None, **kwargs) -> bytes:
         if self._channel == Channel.UNINITIALIZED:
             raise ClientError('Call .channel before running any command')
 
         assert self.pool is not None
-        c = await self.pool.get_connection()
-
-        values = []
-        for k in kwargs:
-            if kwargs[k] is not None:
-                if k == 'limit':
-                    values.append(f'LIMIT({kwargs[k]})')
-                elif k == 'offset':
-                    values.append(f'OFFSET({kwargs[k]})')
-                elif k == 'locale':
-                    values.append(f'LANG({kwargs[k]})')
-                else:
-                    values.append(kwargs[k])
-        await c.write(f'{command.value} {" ".join(args)} {" ".join(values)}'.strip())
 
-        result = await c.read()
-        if command in {Command.QUERY, Command.SUGGEST, Command.LIST}:
-            result = await c.read()
-        await self.pool.release(c)
+        line = encode(command, args, kwargs)
+
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        start = monotonic()
+        error = None  # type: Optional[Exception]
+        cancelled = False
+        try:
+            result = await self._execute(command, line, self.command_timeout if timeout is None else timeout)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = monotonic() - start
+            if self.limiter is not None:
+                self.limiter.release(None if cancelled else elapsed, isinstance(error, (ServerError, Timeout)))
+            if self.cache is not None or self.suggest_cache is not None:
+                self._invalidate_cache(command, args, kwargs)
+            if self.metrics is not None:
+                self.metrics.observe_command(self._channel.value, command.value, elapsed, error)
+        if self.consolidator is not None and command in {Command.PUSH, Command.POP}:
+            self.consolidator.written()
+        if self.journal is not None and command in JOURNALED:
+            self.journal.append(command, args, kwargs.get('locale'))
         if command == Command.QUIT:
             await self.pool.destroy()
         return result
+
+    async def _execute(self, command: Command, line: str, timeout: Optional[float]) -> bytes:
+        assert self.pool is not None
+        if self.multiplex:
+            c = await self.pool.get_shared_connection()
+            return await c.request(line, wait_event=command in event_commands, timeout=timeout)
+
+        c = await self.pool.get_connection(current_priority.get() or self.priorities.get(command))
+        try:
+            result = await with_timeout(self._round_trip(c, command, line), timeout, command.value)
+        except ServerError:
+            # the server replied, the connection can be reused
+            await self.pool.release(c)
+            raise
+        except BaseException:
+            # a reply may still be on its way, the connection can't be reused
+            await self.pool.discard(c)
+            raise
+        await self.pool.release(c)
+        return result
+
+    async def _round_trip(self, c: Connection, command: Command, line: str) -> bytes:
+        await c.write(line)
+        result = await c.read()
+        if command in event_commands:
+            result = await c.read()
+        return result
+
+    def _invalidate_cache(self, command: Command, args: tuple, kwargs: dict) -> None:
+        for cache in (self.cache, self.suggest_cache):
+            if cache is None:
+                continue
+            if command in {Command.PUSH, Command.POP, Command.FLUSHB, Command.FLUSHO}:
+                cache.invalidate(args[0], args[1])
+            elif command == Command.FLUSHC:
+                cache.invalidate(args[0])
+            elif command == Command.TRIGGER and kwargs.get('action') == Action.CONSOLIDATE.value:
+                # suggestions and word lists only change once the index is consolidated
+                cache.invalidate()
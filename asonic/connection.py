@@ -1,31 +1,173 @@
 import asyncio
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from logging import getLogger
+from time import monotonic
 
-from typing import Set, Optional
+from typing import Any, Awaitable, Deque, Dict, Iterator, List, Set, Optional, Tuple, Type
 
-from asonic.enums import Channel
-from asonic.exceptions import ServerError, ConnectionClosed
+from asonic.codec import event_marker, parse_started
+from asonic.enums import Channel, Priority
+from asonic.exceptions import BaseSonicException, ServerError, ConnectionClosed, Timeout
+from asonic.metrics import Metrics
+
+
+async def with_timeout(aw: Awaitable, timeout: Optional[float], message: str) -> Any:
+    """
+    Await `aw`, cancelling it and raising `Timeout` after `timeout` seconds (no limit if None)
+    """
+    if timeout is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, timeout)
+    except asyncio.TimeoutError:
+        raise Timeout(f'{message} timed out after {timeout}s') from None
+
+
+# priority of the commands run in the current context, see `use_priority`
+current_priority = ContextVar('asonic_priority', default=None)  # type: ContextVar[Optional[Priority]]
+
+
+@contextmanager
+def use_priority(priority: Priority) -> Iterator[None]:
+    """
+    Run the commands of this block, and of the tasks it creates, with a priority class::
+
+        with use_priority(Priority.BULK):
+            async for _ in client.push_many(records):
+                ...
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class PriorityScheduler:
+    """
+    Hands out `slots` (pooled connections) to waiting priority classes.
+    When several classes wait, slots go to the class with the least service received relative to its weight (weighted
+    fair queuing), so with the default weights an interactive command passes 4 default and 16 bulk commands, without
+    starving them. A class only gets its fair share from the moment it waits, idle time is not banked.
+    A class holding `caps[class]` slots waits even if slots are free
+    """
+
+    ORDER = (Priority.INTERACTIVE, Priority.DEFAULT, Priority.BULK)
+    WEIGHTS = {Priority.INTERACTIVE: 16, Priority.DEFAULT: 4, Priority.BULK: 1}
+
+    def __init__(self, slots: int, caps: Dict[Priority, int] = None, weights: Dict[Priority, int] = None):
+        """
+        :param slots: number of slots, the max_connections of the pool
+        :param caps: maximum slots held at once by a class (default: no limit)
+        :param weights: share of the slots of each class when they compete
+        """
+        self.slots = slots
+        self.caps = dict(caps or {})
+        self.weights = {**self.WEIGHTS, **(weights or {})}
+        self.held = {priority: 0 for priority in self.ORDER}
+        self.granted = {priority: 0 for priority in self.ORDER}
+        self._waiters = {priority: deque() for priority in self.ORDER}  # type: Dict[Priority, Deque[asyncio.Future]]
+        self._finish = {priority: 0.0 for priority in self.ORDER}
+        self._virtual_time = 0.0
+
+    async def acquire(self, priority: Priority) -> None:
+        waiters = self._waiters[priority]
+        if not waiters:
+            # idle classes don't keep credit
+            self._finish[priority] = max(self._finish[priority], self._virtual_time)
+            if self.slots > 0 and self._allowed(priority) and not any(self._ready()):
+                self._grant(priority)
+                return
+        future = asyncio.get_event_loop().create_future()
+        waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted just before the cancellation, give it back
+                self.release(priority)
+            else:
+                waiters.remove(future)
+            raise
+
+    def release(self, priority: Priority) -> None:
+        self.held[priority] -= 1
+        self.slots += 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            priority.value: {
+                'held': self.held[priority],
+                'waiting': len(self._waiters[priority]),
+                'granted': self.granted[priority],
+            }
+            for priority in self.ORDER
+        }
+
+    def _allowed(self, priority: Priority) -> bool:
+        cap = self.caps.get(priority)
+        return cap is None or self.held[priority] < cap
+
+    def _ready(self) -> Iterator[Priority]:
+        return (priority for priority in self.ORDER if self._waiters[priority] and self._allowed(priority))
+
+    def _dispatch(self) -> None:
+        while self.slots > 0:
+            # the first class of ORDER wins ties
+            priority = min(self._ready(), key=lambda p: self._finish[p], default=None)
+            if priority is None:
+                return
+            future = self._waiters[priority].popleft()
+            if future.done():
+                continue
+            self._grant(priority)
+            future.set_result(None)
+
+    def _grant(self, priority: Priority) -> None:
+        self.slots -= 1
+        self.held[priority] += 1
+        self.granted[priority] += 1
+        self._virtual_time = self._finish[priority]
+        self._finish[priority] += 1 / self.weights[priority]
 
 
 class Connection:
-    def __init__(self, host: str, port: int, channel: Channel, password: str):
+    def __init__(self, host: str, port: int, channel: Channel, password: str, metrics: Metrics = None):
         self.host = host
         self.port = port
         self.channel = channel
         self.password = password
+        self.metrics = metrics
         self.reader = None  # type: Optional[asyncio.StreamReader]
         self.writer = None  # type: Optional[asyncio.StreamWriter]
         self.logger = getLogger('connection')
+        self.buffer = None  # type: Optional[int]
+        self.last_used = monotonic()
+
+        self._reader_task = None  # type: Optional[asyncio.Task]
+        # caller, whether it waits for an EVENT, time the command was queued
+        self._waiters = deque()  # type: Deque[Tuple[asyncio.Future, bool, float]]
+        self._events = {}  # type: Dict[bytes, asyncio.Future]
+        # waiters whose caller gave up, they stay queued until their reply is read
+        self._abandoned = set()  # type: Set[asyncio.Future]
+        self._write_buffer = []  # type: List[bytes]
+        self._drain_task = None  # type: Optional[asyncio.Future]
 
     async def connect(self) -> None:
         self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        await self._handshake()
+
+    async def _handshake(self) -> None:
         result = await self.read()
         assert result.startswith(b'CONNECTED')
 
         await self.write(f'START {self.channel.value} {self.password}')
         result = await self.read()
         if result.startswith(b'STARTED'):
-            pass
+            self.buffer = parse_started(result)
         elif result.startswith(b'ENDED'):
             raise ConnectionClosed(f"Error {result}")
         else:
@@ -34,51 +176,423 @@ class Connection:
     async def write(self, msg: str) -> None:
         assert self.writer is not None, 'connect'
         self.logger.debug('>%s', msg)
-        self.writer.write(((msg + '\r\n').encode()))
+        data = (msg + '\r\n').encode()
+        if self.metrics is not None:
+            self.metrics.bytes_written += len(data)
+        self.writer.write(data)
         await self.writer.drain()
 
     async def read(self) -> bytes:
         assert self.reader is not None
-        line = (await self.reader.readline()).strip()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionClosed('Connection closed by server')
+        if self.metrics is not None:
+            self.metrics.bytes_read += len(line)
+        line = line.strip()
         self.logger.debug('<%s', line)
         if line.startswith(b'ERR '):
             raise ServerError(line[4:])
         return line
 
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of commands sent on a multiplexed connection that are still waiting for a reply, without the ones
+        whose caller gave up
+        """
+        return len(self._waiters) - len(self._abandoned) + len(self._events)
+
+    @property
+    def reading(self) -> bool:
+        """
+        Whether replies are routed to the callers of `request`, see `start_reader`
+        """
+        return self._reader_task is not None and not self._reader_task.done()
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the connection was closed, by either side
+        """
+        if self.writer is None or self.reader is None:
+            return False
+        if self._reader_task is not None and self._reader_task.done():
+            return True
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def start_reader(self) -> None:
+        """
+        Switch the connection to multiplexed mode: a background task reads every reply and hands it to the
+        matching caller of `request`, so many commands can be in flight on this connection at once
+        """
+        assert self.reader is not None, 'connect'
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def request(self, msg: str, wait_event: bool = False, timeout: float = None) -> bytes:
+        """
+        Send a command on a multiplexed connection and wait for its reply.
+        Commands sent during the same event loop iteration are coalesced into a single write, their replies are
+        matched back in order
+        :param msg: command line to be sent
+        :param wait_event: if set, wait for the `EVENT` line announced by the `PENDING <marker>` reply
+        :param timeout: seconds to wait for the reply; only this caller gives up, its reply is dropped when it arrives.
+        The connection is closed when it looks stuck, ie. the oldest command still has no direct reply (Sonic answers
+        `PENDING` at once, only the `EVENT` may take time)
+        """
+        if not self.reading:
+            raise ConnectionClosed('Connection is not reading')
+        if self._write_blocked():
+            # the server reads slower than commands are sent, wait instead of buffering them without limit
+            await with_timeout(asyncio.shield(self._drained()), timeout, msg.split(' ', 1)[0])
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.logger.debug('>%s', msg)
+        if not self._write_buffer:
+            loop.call_soon(self._flush)
+        # Sonic answers commands of a connection in order, so the waiter queue and the socket must stay in sync
+        self._waiters.append((future, wait_event, monotonic()))
+        self._write_buffer.append((msg + '\r\n').encode())
+        try:
+            return await with_timeout(future, timeout, msg.split(' ', 1)[0])
+        except Timeout:
+            assert timeout is not None
+            if self._waiters and monotonic() - self._waiters[0][2] >= timeout:
+                # no reply at all for `timeout` seconds, every command on this connection is stalled
+                await self.close()
+            raise
+        finally:
+            if future.cancelled():
+                self._abandon(future)
+
+    def _abandon(self, future: asyncio.Future) -> None:
+        if any(waiting is future for waiting, _, _ in self._waiters):
+            self._abandoned.add(future)
+            return
+        for marker, waiting in self._events.items():
+            if waiting is future:
+                # its EVENT is dropped when it arrives
+                del self._events[marker]
+                return
+
+    def _write_blocked(self) -> bool:
+        assert self.writer is not None
+        transport = self.writer.transport
+        return transport.get_write_buffer_size() > transport.get_write_buffer_limits()[1]
+
+    def _drained(self) -> asyncio.Future:
+        # a single drain for every caller, concurrent drain() calls fail before Python 3.10
+        assert self.writer is not None
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.ensure_future(self.writer.drain())
+        return self._drain_task
+
+    def _flush(self) -> None:
+        assert self.writer is not None
+        data = b''.join(self._write_buffer)
+        self._write_buffer.clear()
+        if self.metrics is not None:
+            self.metrics.bytes_written += len(data)
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def _read_loop(self) -> None:
+        assert self.reader is not None
+        error = ConnectionClosed('Connection closed')  # type: Exception
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                if self.metrics is not None:
+                    self.metrics.bytes_read += len(line)
+                line = line.strip()
+                self.logger.debug('<%s', line)
+                self._dispatch(line)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            error = ConnectionClosed(f'Connection lost: {e!r}')
+        finally:
+            self._fail_all(error)
+
+    def _dispatch(self, line: bytes) -> None:
+        if line.startswith(b'EVENT '):
+            marker = event_marker(line)
+            future = self._events.pop(marker, None) if marker is not None else None
+            if future is not None and not future.done():
+                future.set_result(line)
+            return
+        if not self._waiters:
+            self.logger.warning('Unexpected reply %s', line)
+            return
+        future, wait_event, _ = self._waiters.popleft()
+        self._abandoned.discard(future)
+        if future.done():
+            # caller went away, its EVENT (if any) will be dropped since the marker is never registered
+            return
+        if wait_event and line.startswith(b'PENDING '):
+            self._events[line[8:]] = future
+        elif line.startswith(b'ERR '):
+            future.set_exception(ServerError(line[4:]))
+        else:
+            future.set_result(line)
+
+    def _fail_all(self, error: Exception) -> None:
+        futures = [future for future, _, _ in self._waiters] + list(self._events.values())
+        self._waiters.clear()
+        self._events.clear()
+        self._abandoned.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
 
 class ConnectionPool:
-    def __init__(self, host: str, port: int, channel: Channel, password: str, max_connections: int = 100):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        channel: Channel,
+        password: str,
+        max_connections: int = 100,
+        max_in_flight: int = 16,
+        min_connections: int = 0,
+        idle_timeout: float = None,
+        metrics: Metrics = None,
+        connect_timeout: float = None,
+        pool_timeout: float = None,
+        connection_class: Type[Connection] = Connection,
+        priority_caps: Dict[Priority, int] = None,
+        priority_weights: Dict[Priority, int] = None
+    ):
+        """
+        :param connection_class: `Connection` (asyncio streams) or `asonic.protocol.ProtocolConnection`
+        :param priority_caps: maximum connections checked out at once by a priority class, see `PriorityScheduler`
+        :param priority_weights: share of the connections of each priority class when they compete
+        """
         self.closed = False
         self._created_connections = 0
-        self._available_connections = asyncio.Queue()  # type: asyncio.Queue[Connection]
+        # holds idle connections, and None for each slot freed by a discarded connection to wake up a waiter
+        self._available_connections = asyncio.Queue()  # type: asyncio.Queue[Optional[Connection]]
         self._in_use_connections = set()  # type: Set[Connection]
+        self.scheduler = PriorityScheduler(max_connections, priority_caps, priority_weights)
+        # priority class each connection in use was checked out with
+        self._priorities = {}  # type: Dict[Connection, Priority]
+        self._shared_connections = []  # type: List[Connection]
+        self._shared_connection_added = asyncio.Event()
+        self._maintenance_task = None  # type: Optional[asyncio.Task]
+        self.logger = getLogger('connection_pool')
         self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.min_connections = min(min_connections, max_connections)
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self.buffer = None  # type: Optional[int]
         self.host = host
         self.port = port
         self.password = password
         self.channel = channel
+        self.metrics = metrics
+        self.connection_class = connection_class
+        if metrics is not None:
+            metrics.pools.add(self)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of connections in use (running a command) and idle
+        """
+        in_use = len(self._in_use_connections) + sum(1 for c in self._shared_connections if c.in_flight)
+        return {'in_use': in_use, 'idle': self._created_connections - in_use}
+
+    async def fill(self, shared: bool = False) -> None:
+        """
+        Open connections in parallel until `min_connections` are open.
+        When `idle_timeout` is set, also start a task that closes connections idle for longer than `idle_timeout`
+        (keeping `min_connections` open)
+        :param shared: open multiplexed connections, see `get_shared_connection`
+        """
+        missing = self.min_connections - self._created_connections
+        if missing > 0:
+            make = self._make_shared_connection if shared else self._make_idle_connection
+            results = await asyncio.gather(*(make() for _ in range(missing)), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        if self.idle_timeout is not None and not shared and self._maintenance_task is None:
+            self._maintenance_task = asyncio.ensure_future(self._maintain())
 
-    async def get_connection(self) -> Connection:
-        if self.closed is True:
-            raise ConnectionClosed('Connection pool is closed')
+    async def get_connection(self, priority: Priority = None) -> Connection:
+        """
+        Check out a connection, waiting behind the commands of higher priority classes when the pool is full
+        :param priority: priority class (default: `use_priority` of the context, or DEFAULT)
+        """
+        priority = priority or current_priority.get() or Priority.DEFAULT
+        if self.metrics is None:
+            return await with_timeout(self._checkout(priority), self.pool_timeout, 'Connection checkout')
+        start = monotonic()
         try:
-            connection = self._available_connections.get_nowait()
-        except asyncio.QueueEmpty:
-            connection = await self.make_connection()
-        self._in_use_connections.add(connection)
+            return await with_timeout(self._checkout(priority), self.pool_timeout, 'Connection checkout')
+        finally:
+            self.metrics.observe_pool_wait(self.channel.value, monotonic() - start)
+
+    async def _checkout(self, priority: Priority) -> Connection:
+        await self.scheduler.acquire(priority)
+        try:
+            connection = await self._get_connection()
+        except BaseException:
+            self.scheduler.release(priority)
+            raise
+        self._priorities[connection] = priority
         return connection
 
+    async def _get_connection(self) -> Connection:
+        while True:
+            if self.closed is True:
+                raise ConnectionClosed('Connection pool is closed')
+            try:
+                connection = self._available_connections.get_nowait()
+            except asyncio.QueueEmpty:
+                connection = None
+            if connection is None:
+                connection = await self.make_connection()
+            if connection.closed or self._idle_expired(connection):
+                # closed by the server or idle for too long, replace it
+                await self.discard(connection)
+                continue
+            self._in_use_connections.add(connection)
+            return connection
+
     async def make_connection(self) -> Connection:
-        if self._created_connections >= self.max_connections:
-            return await self._available_connections.get()
-        self._created_connections += 1
-        c = Connection(self.host, self.port, self.channel, self.password)
-        await c.connect()
-        return c
+        while self._created_connections >= self.max_connections:
+            connection = await self._available_connections.get()
+            if connection is not None:
+                return connection
+        return await self._open()
 
     async def release(self, connection: Connection) -> None:
         self._in_use_connections.remove(connection)
+        connection.last_used = monotonic()
         await self._available_connections.put(connection)
+        self._release_slot(connection)
+
+    async def discard(self, connection: Connection) -> None:
+        """
+        Close a connection (eg. after an error left it in an unknown state) and free its slot
+        """
+        self._in_use_connections.discard(connection)
+        self._created_connections -= 1
+        await connection.close()
+        self._available_connections.put_nowait(None)
+        self._release_slot(connection)
+
+    def _release_slot(self, connection: Connection) -> None:
+        priority = self._priorities.pop(connection, None)
+        if priority is not None:
+            self.scheduler.release(priority)
+
+    def _idle_expired(self, connection: Connection) -> bool:
+        return self.idle_timeout is not None and monotonic() - connection.last_used > self.idle_timeout
+
+    async def _open(self) -> Connection:
+        self._created_connections += 1
+        c = self.connection_class(self.host, self.port, self.channel, self.password, metrics=self.metrics)
+        try:
+            await with_timeout(c.connect(), self.connect_timeout, 'Connect')
+        except BaseException:
+            self._created_connections -= 1
+            await c.close()
+            raise
+        self.buffer = c.buffer
+        return c
+
+    async def _make_idle_connection(self) -> None:
+        connection = await self._open()
+        await self._available_connections.put(connection)
+
+    async def _maintain(self) -> None:
+        assert self.idle_timeout is not None
+        while not self.closed:
+            await asyncio.sleep(self.idle_timeout / 2)
+            idle = []
+            while not self._available_connections.empty():
+                idle.append(self._available_connections.get_nowait())
+            for connection in idle:
+                if connection is None:
+                    continue
+                if connection.closed or (
+                    self._idle_expired(connection) and self._created_connections > self.min_connections
+                ):
+                    self._created_connections -= 1
+                    await connection.close()
+                else:
+                    self._available_connections.put_nowait(connection)
+            try:
+                await self.fill()
+            except (OSError, BaseSonicException) as e:
+                self.logger.warning('Failed to open connections: %r', e)
+
+    async def get_shared_connection(self) -> Connection:
+        """
+        Get a multiplexed connection, shared with other callers.
+        The least busy connection is returned, a new one is opened only when every connection already has
+        `max_in_flight` pending commands and `max_connections` is not reached.
+        """
+        if self.metrics is None:
+            return await with_timeout(self._get_shared_connection(), self.pool_timeout, 'Connection checkout')
+        start = monotonic()
+        try:
+            return await with_timeout(self._get_shared_connection(), self.pool_timeout, 'Connection checkout')
+        finally:
+            self.metrics.observe_pool_wait(self.channel.value, monotonic() - start)
+
+    async def _get_shared_connection(self) -> Connection:
+        while True:
+            if self.closed is True:
+                raise ConnectionClosed('Connection pool is closed')
+            for connection in [c for c in self._shared_connections if c.closed]:
+                self._shared_connections.remove(connection)
+                self._created_connections -= 1
+                await connection.close()
+
+            connection = min(self._shared_connections, key=lambda c: c.in_flight, default=None)
+            if connection is not None and (
+                connection.in_flight < self.max_in_flight or self._created_connections >= self.max_connections
+            ):
+                return connection
+            if self._created_connections < self.max_connections:
+                return await self._make_shared_connection()
+            # every allowed connection is still being opened
+            self._shared_connection_added.clear()
+            await self._shared_connection_added.wait()
+
+    async def _make_shared_connection(self) -> Connection:
+        try:
+            c = await self._open()
+        finally:
+            self._shared_connection_added.set()
+        c.start_reader()
+        self._shared_connections.append(c)
+        return c
 
     async def destroy(self):
         self.closed = True
+        if self.metrics is not None:
+            self.metrics.pools.discard(self)
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+        for connection in self._shared_connections:
+            await connection.close()
+        self._shared_connections.clear()
+        self._shared_connection_added.set()
+        while not self._available_connections.empty():
+            connection = self._available_connections.get_nowait()
+            if connection is not None:
+                await connection.close()
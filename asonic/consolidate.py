@@ -0,0 +1,159 @@
+"""
+Background CONSOLIDATE scheduling: new words are only searchable once Sonic consolidated its index, triggering it after
+every write is expensive and never triggering it leaves results stale::
+
+    control = await Client.create(channel=Channel.CONTROL)
+    consolidator = Consolidator(control, max_writes=1000, max_delay=30, quiet=2)
+    ingest = await Client.create(channel=Channel.INGEST, consolidator=consolidator)
+"""
+import asyncio
+from logging import getLogger
+from time import monotonic, time
+
+from typing import Callable, Dict, Optional
+
+from asonic.enums import Action
+from asonic.exceptions import BaseSonicException
+
+
+class Consolidator:
+    """
+    Counts the PUSH and POP of the ingest clients it is given to, and triggers CONSOLIDATE on a control channel
+    client after `max_writes` writes, `max_delay` seconds after the first pending write or once no write happened for
+    `quiet` seconds, whichever comes first; never more often than every `min_interval` seconds.
+    Writes made while a consolidation runs are left for the next one.
+    The scheduler task starts with the first write, it is stopped by `close` (or `Client.close` of an ingest client)
+    """
+
+    def __init__(
+        self,
+        control,
+        max_writes: int = 1000,
+        max_delay: float = 30.0,
+        quiet: float = 2.0,
+        min_interval: float = 5.0,
+        retry_delay: float = 1.0,
+        clock: Callable[[], float] = monotonic
+    ):
+        """
+        :param control: `Client` of the control channel
+        :param max_writes: pending writes triggering a consolidation
+        :param max_delay: seconds a write may wait for a consolidation
+        :param quiet: seconds without writes after which pending writes are consolidated
+        :param min_interval: minimum seconds between two consolidations
+        :param retry_delay: seconds before retrying a failed consolidation
+        """
+        self.control = control
+        self.max_writes = max_writes
+        self.max_delay = max_delay
+        self.quiet = quiet
+        self.min_interval = min_interval
+        self.retry_delay = retry_delay
+        self.clock = clock
+
+        self.pending = 0
+        self.runs = 0
+        self.failures = 0
+        # wall clock time of the last successful consolidation
+        self.last_run = None  # type: Optional[float]
+        self.logger = getLogger('consolidator')
+
+        self._first_write = None  # type: Optional[float]
+        self._last_write = None  # type: Optional[float]
+        self._last_attempt = None  # type: Optional[float]
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None  # type: Optional[asyncio.Task]
+        self._closed = False
+
+    def written(self, count: int = 1) -> None:
+        """
+        Record writes, called by the ingest `Client` after every successful PUSH and POP
+        """
+        now = self.clock()
+        if not self.pending:
+            self._first_write = now
+        self.pending += count
+        self._last_write = now
+        if self._task is None and not self._closed:
+            self._task = asyncio.ensure_future(self._run())
+        if self.pending == count or self.pending >= self.max_writes:
+            # the next deadline moved earlier
+            self._wake.set()
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds until the next consolidation, None without pending writes
+        """
+        if not self.pending:
+            return None
+        assert self._first_write is not None and self._last_write is not None
+        if self.pending >= self.max_writes:
+            due = self.clock()
+        else:
+            due = min(self._first_write + self.max_delay, self._last_write + self.quiet)
+        if self._last_attempt is not None:
+            due = max(due, self._last_attempt + self.min_interval)
+        return max(due - self.clock(), 0.0)
+
+    async def consolidate(self) -> bool:
+        """
+        Trigger a consolidation of the pending writes now, returns whether it succeeded
+        """
+        async with self._lock:
+            if not self.pending:
+                return True
+            pending, first_write = self.pending, self._first_write
+            self.pending = 0
+            self._last_attempt = self.clock()
+            try:
+                await self.control.trigger(Action.CONSOLIDATE)
+            except BaseException as e:
+                # retried on the next deadline
+                self._first_write = first_write
+                self.pending += pending
+                if not isinstance(e, (OSError, BaseSonicException)):
+                    raise
+                self.logger.warning('Failed to consolidate: %r', e)
+                self.failures += 1
+                return False
+            self.runs += 1
+            self.last_run = time()
+            return True
+
+    async def close(self, flush: bool = True) -> None:
+        """
+        Stop the scheduler
+        :param flush: consolidate the pending writes first
+        """
+        self._closed = True
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if flush:
+            await self.consolidate()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            'pending': self.pending,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_run': self.last_run,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            delay = self.delay()
+            if delay is None or delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if not await self.consolidate():
+                await asyncio.sleep(self.retry_delay)
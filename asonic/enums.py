@@ -27,6 +27,12 @@ class Command(Enum):
     LIST = 'LIST'
 
 
+class Priority(Enum):
+    INTERACTIVE = 'interactive'
+    DEFAULT = 'default'
+    BULK = 'bulk'
+
+
 class Channel(Enum):
     UNINITIALIZED = 'uninitialized'
     INGEST = 'ingest'
@@ -66,3 +72,10 @@ enabled_commands = {
 }
 
 all_commands = set(chain(*enabled_commands.values()))  # type: Set[Command]
+
+# commands answered with `PENDING <marker>` first and `EVENT <command> <marker> ...` later
+event_commands = {
+    Command.QUERY,
+    Command.SUGGEST,
+    Command.LIST,
+}  # type: Set[Command]
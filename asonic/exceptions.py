@@ -12,3 +12,7 @@ class ConnectionClosed(ClientError):
 
 class ServerError(BaseSonicException):
     pass
+
+
+class Timeout(ClientError):
+    pass
@@ -0,0 +1,365 @@
+"""
+Bulk loader: streams JSONL or CSV files (or stdin) into Sonic. Records are parsed, preprocessed, chunked and escaped by
+batches in a process pool while the pushes of the previous batches are in flight on the ingest connections.
+With --checkpoint, the input offset up to which every record was pushed is saved, and a run starting with the same
+checkpoint file resumes from there. Records that failed to push are reported on stderr and make the exit status 1,
+they are not retried when resuming.
+Usage: python -m asonic.ingest --collection COLLECTION (--bucket BUCKET | --bucket-field FIELD) [--id-field FIELD]
+                               [--text-field FIELD ...] [--locale-field FIELD] [--format {jsonl,csv}]
+                               [--strip-markup] [--lowercase] [--dedupe] [--max-bytes N]
+                               [--workers N] [--batch-size N] [--concurrency N] [--checkpoint FILE]
+                               [--host HOST] [--port PORT] [--password PASSWORD] [FILE ...]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from asonic import Client
+from asonic.client import BUFFER, chunk_text, escape, push_overhead, run_many
+from asonic.enums import Channel
+from asonic.preprocess import Preprocessor
+
+STDIN = '-'
+
+# (bucket, object, escaped chunks, locale)
+Prepared = Tuple[str, str, List[str], Optional[str]]
+
+_settings = {}  # type: Dict[str, Any]
+_preprocessor = None  # type: Optional[Preprocessor]
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m asonic.ingest', description='Bulk load JSONL or CSV into Sonic')
+    parser.add_argument('files', nargs='*', default=[STDIN], help='input files, - for stdin (default)')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help='input format (default: from the file extension)')
+    parser.add_argument('--collection', required=True)
+    bucket = parser.add_mutually_exclusive_group(required=True)
+    bucket.add_argument('--bucket', help='bucket of every record')
+    bucket.add_argument('--bucket-field', help='field holding the bucket of a record')
+    parser.add_argument('--id-field', default='id', help='field holding the object identifier')
+    parser.add_argument('--text-field', action='append', help='field(s) holding the text (default: text)')
+    parser.add_argument('--locale-field', help='field holding the ISO 639-3 locale of a record')
+    parser.add_argument('--strip-markup', action='store_true', help='remove HTML/XML markup')
+    parser.add_argument('--lowercase', action='store_true')
+    parser.add_argument('--dedupe', action='store_true', help='keep the first occurrence of every word only')
+    parser.add_argument('--max-bytes', type=int, help='truncate texts to this many bytes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes preparing the records, 0 to prepare them in the loader process')
+    parser.add_argument('--batch-size', type=int, default=1000, help='records sent to a worker at once')
+    parser.add_argument('--concurrency', type=int, default=32, help='records pushed at once')
+    parser.add_argument('--checkpoint', help='file where the progress is saved and resumed from')
+    parser.add_argument('--checkpoint-interval', type=float, default=5.0, help='seconds between checkpoint writes')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='seconds between progress lines')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1491)
+    parser.add_argument('--password', default='SecretPassword')
+    args = parser.parse_args(argv)
+    args.text_field = args.text_field or ['text']
+    return args
+
+
+def input_format(path: str, fmt: Optional[str]) -> str:
+    if fmt is not None:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_records(stream: BinaryIO, quoted: bool = False) -> Iterator[bytes]:
+    """
+    Raw records of a stream, one per line; with `quoted` (CSV), lines are joined until their quotes are balanced
+    """
+    pending = b''
+    for line in stream:
+        if quoted:
+            pending += line
+            if pending.count(b'"') % 2:
+                continue
+            line, pending = pending, b''
+        yield line
+    if pending:
+        yield pending
+
+
+def load_checkpoint(path: Optional[str]) -> Dict[str, int]:
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, offsets: Dict[str, int]) -> None:
+    with open(path + '.tmp', 'w') as f:
+        json.dump(offsets, f)
+    os.replace(path + '.tmp', path)
+
+
+def init_worker(settings: Dict[str, Any]) -> None:
+    global _settings, _preprocessor
+    _settings = settings
+    _preprocessor = Preprocessor(
+        lowercase=settings['lowercase'],
+        strip_markup=settings['strip_markup'],
+        dedupe=settings['dedupe'],
+        max_bytes=settings['max_bytes'],
+    )
+
+
+def prepare(fmt: str, header: Optional[List[str]], batch: List[bytes]) -> Tuple[List[Prepared], int]:
+    """
+    Parse, preprocess, chunk and escape a batch of raw records, returns the prepared records and the number of
+    records skipped (invalid, without identifier or without text)
+    """
+    assert _preprocessor is not None, 'init_worker'
+    parsed = []  # type: List[Tuple[str, str, str, Optional[str]]]
+    skipped = 0
+    for raw in batch:
+        if not raw.strip():
+            continue
+        try:
+            if fmt == 'csv':
+                row = next(csv.reader([raw.decode()]))
+                record = dict(zip(header or [], row))  # type: Dict[str, Any]
+            else:
+                record = json.loads(raw)
+        except (ValueError, StopIteration):
+            skipped += 1
+            continue
+        if not isinstance(record, dict):
+            skipped += 1
+            continue
+        bucket = _settings['bucket'] or record.get(_settings['bucket_field'])
+        obj = record.get(_settings['id_field'])
+        # 0 or False are valid values, only missing ones are left out
+        values = [str(record[field]) for field in _settings['text_fields'] if record.get(field) is not None]
+        text = ' '.join(value for value in values if value)
+        if bucket in (None, '') or obj in (None, '') or not text:
+            skipped += 1
+            continue
+        locale = record.get(_settings['locale_field']) if _settings['locale_field'] else None
+        parsed.append((str(bucket), str(obj), text, locale or None))
+
+    texts = _preprocessor.process_many([text for _, _, text, _ in parsed])
+    prepared = []  # type: List[Prepared]
+    for (bucket, obj, _, locale), text in zip(parsed, texts):
+        size = _settings['buffer'] - push_overhead(_settings['collection'], bucket, obj, locale)
+        chunks = [escape(chunk) for chunk in chunk_text(text, size)]
+        if chunks:
+            prepared.append((bucket, obj, chunks, locale))
+        else:
+            skipped += 1
+    return prepared, skipped
+
+
+class Progress:
+    """
+    Counters of a run, printed every `interval` seconds
+    """
+
+    def __init__(self, interval: float, out=sys.stderr):
+        self.interval = interval
+        self.out = out
+        self.stats = {'docs': 0, 'chunks': 0, 'bytes': 0, 'skipped': 0, 'errors': 0}
+        self.start = self._last = time.monotonic()
+
+    def tick(self) -> None:
+        if time.monotonic() - self._last >= self.interval:
+            self.print()
+
+    def print(self) -> None:
+        self._last = time.monotonic()
+        elapsed = max(self._last - self.start, 1e-9)
+        print(
+            f'{self.stats["docs"]} docs ({self.stats["docs"] / elapsed:.0f} docs/s), '
+            f'{self.stats["bytes"] / 1e6:.1f} MB ({self.stats["bytes"] / 1e6 / elapsed:.2f} MB/s), '
+            f'{self.stats["skipped"]} skipped, {self.stats["errors"]} errors',
+            file=self.out, flush=True
+        )
+
+
+class Checkpoint:
+    """
+    Input offset up to which every batch was pushed, batches complete in any order
+    """
+
+    def __init__(self, path: Optional[str], interval: float, offsets: Dict[str, int]):
+        self.path = path
+        self.interval = interval
+        self.offsets = offsets
+        self._remaining = {}  # type: Dict[int, int]
+        self._ends = {}  # type: Dict[int, Tuple[str, int]]
+        self._next = 0
+        self._saved = time.monotonic()
+
+    def add(self, batch: int, name: str, end: int, records: int) -> None:
+        self._remaining[batch] = records
+        self._ends[batch] = (name, end)
+        self._advance()
+
+    def done(self, batch: int) -> None:
+        self._remaining[batch] -= 1
+        self._advance()
+
+    def save(self) -> None:
+        if self.path is not None:
+            save_checkpoint(self.path, self.offsets)
+        self._saved = time.monotonic()
+
+    def _advance(self) -> None:
+        while self._remaining.get(self._next) == 0:
+            del self._remaining[self._next]
+            name, end = self._ends.pop(self._next)
+            self.offsets[name] = end
+            self._next += 1
+        if self.path is not None and time.monotonic() - self._saved >= self.interval:
+            self.save()
+
+
+def _batches(
+    stream: BinaryIO, fmt: str, start: int, batch_size: int
+) -> Iterator[Tuple[Optional[List[str]], List[bytes], int]]:
+    header = None
+    offset = 0
+    records = read_records(stream, quoted=fmt == 'csv')
+    if fmt == 'csv':
+        first = next(records, b'')
+        header = next(csv.reader([first.decode()]), [])
+        offset = len(first)
+    if start > offset:
+        if stream.seekable():
+            stream.seek(start)
+        else:
+            _skip(stream, start - offset)
+        offset = start
+        records = read_records(stream, quoted=fmt == 'csv')
+    batch = []  # type: List[bytes]
+    for raw in records:
+        batch.append(raw)
+        offset += len(raw)
+        if len(batch) >= batch_size:
+            yield header, batch, offset
+            batch = []
+    if batch:
+        yield header, batch, offset
+
+
+def _skip(stream: BinaryIO, size: int) -> None:
+    while size > 0:
+        data = stream.read(min(size, 1 << 20))
+        if not data:
+            return
+        size -= len(data)
+
+
+async def _prepared(
+    args: argparse.Namespace, executor: Optional[Executor], checkpoint: Checkpoint, progress: Progress
+) -> AsyncIterator[Tuple[int, Prepared]]:
+    """
+    Prepared records of every input with their batch number, a few batches are prepared ahead
+    """
+    loop = asyncio.get_event_loop()
+    ahead = max(args.workers, 1) * 2
+    batch_number = 0
+    for name in args.files:
+        fmt = input_format(name, args.format)
+        stream = sys.stdin.buffer if name == STDIN else open(name, 'rb')
+        try:
+            pending = []  # type: List[Tuple[asyncio.Future, int, int]]
+            batches = _batches(stream, fmt, checkpoint.offsets.get(name, 0), args.batch_size)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < ahead:
+                    item = next(batches, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    header, batch, end = item
+                    if executor is None:
+                        future = loop.create_future()
+                        future.set_result(prepare(fmt, header, batch))
+                    else:
+                        future = loop.run_in_executor(executor, prepare, fmt, header, batch)
+                    pending.append((future, end, sum(len(raw) for raw in batch)))
+                if not pending:
+                    break
+                future, end, size = pending.pop(0)
+                records, skipped = await future
+                progress.stats['skipped'] += skipped
+                progress.stats['bytes'] += size
+                checkpoint.add(batch_number, name, end, len(records))
+                for record in records:
+                    yield batch_number, record
+                batch_number += 1
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+
+async def load(args: argparse.Namespace) -> Dict[str, int]:
+    """
+    Run a bulk load, returns the counters of the run
+    """
+    client = await Client.create(
+        host=args.host, port=args.port, password=args.password, channel=Channel.INGEST,
+        max_connections=args.concurrency
+    )
+    assert client.pool is not None
+    settings = {
+        'collection': args.collection,
+        'bucket': args.bucket,
+        'bucket_field': args.bucket_field,
+        'id_field': args.id_field,
+        'text_fields': args.text_field,
+        'locale_field': args.locale_field,
+        'lowercase': args.lowercase,
+        'strip_markup': args.strip_markup,
+        'dedupe': args.dedupe,
+        'max_bytes': args.max_bytes,
+        'buffer': client.pool.buffer or BUFFER,
+    }
+    executor = None  # type: Optional[Executor]
+    if args.workers > 0:
+        executor = ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(settings,))
+    else:
+        init_worker(settings)
+    checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval, load_checkpoint(args.checkpoint))
+    progress = Progress(args.progress_interval)
+
+    async def push(batch_number: int, record: Prepared) -> None:
+        bucket, obj, chunks, locale = record
+        await client.push_chunks(args.collection, bucket, obj, chunks, locale)
+
+    try:
+        outcomes = run_many(push, _prepared(args, executor, checkpoint, progress), args.concurrency)
+        async for (batch_number, record), result in outcomes:
+            if isinstance(result, Exception):
+                progress.stats['errors'] += 1
+                print(f'Failed to push {record[1]}: {result!r}', file=sys.stderr)
+            else:
+                progress.stats['docs'] += 1
+                progress.stats['chunks'] += len(record[2])
+            checkpoint.done(batch_number)
+            progress.tick()
+        checkpoint.save()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        await client.pool.destroy()
+    progress.print()
+    return progress.stats
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    stats = asyncio.run(load(args))
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
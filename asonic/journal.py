@@ -0,0 +1,250 @@
+"""
+Append-only journal of the writes of an ingest client, to rebuild or re-shard a Sonic node without reading the primary
+database again (Sonic can't export the indexed text)::
+
+    journal = Journal('/var/lib/app/sonic-journal')
+    ingest = await Client.create(channel=Channel.INGEST, journal=journal)
+    ...
+    fresh = await Client.create(host='new-node', channel=Channel.INGEST, multiplex=True)
+    await fresh.replay('/var/lib/app/sonic-journal')
+
+Records are written to numbered segment files, as sent to Sonic (escaped text chunks), each with its length and CRC32
+so a record torn by a crash is detected and dropped.
+"""
+import mmap
+import os
+import shutil
+import struct
+import zlib
+from logging import getLogger
+from time import monotonic
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from asonic.enums import Command
+
+OPS = (Command.PUSH, Command.POP, Command.FLUSHC, Command.FLUSHB, Command.FLUSHO)
+FLUSHES = frozenset((Command.FLUSHC, Command.FLUSHB, Command.FLUSHO))
+SUFFIX = '.journal'
+# compacted segments being written, then once complete
+COMPACTING = 'compact'
+COMPACTED = 'compacted'
+# in a compaction directory, index of its first segment: the segments below it are superseded
+FIRST = 'first'
+
+Record = Tuple[Command, Tuple[Optional[str], ...]]
+
+# payload length, CRC32 of the payload
+_HEADER = struct.Struct('<II')
+# field length, _NONE for a missing locale
+_LENGTH = struct.Struct('<I')
+_NONE = 0xFFFFFFFF
+
+logger = getLogger('journal')
+
+
+def encode_record(command: Command, fields: Sequence[Optional[str]]) -> bytes:
+    payload = bytearray((OPS.index(command),))
+    for field in fields:
+        if field is None:
+            payload += _LENGTH.pack(_NONE)
+        else:
+            data = field.encode()
+            payload += _LENGTH.pack(len(data))
+            payload += data
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(buffer: memoryview) -> Iterator[Tuple[Record, int]]:
+    """
+    Records of a segment with the offset following each of them, stops at the first incomplete or corrupted one
+    """
+    offset = 0
+    size = len(buffer)
+    while offset + _HEADER.size <= size:
+        length, crc = _HEADER.unpack_from(buffer, offset)
+        start = offset + _HEADER.size
+        end = start + length
+        if not length or end > size or zlib.crc32(buffer[start:end]) != crc or buffer[start] >= len(OPS):
+            return
+        fields = []  # type: List[Optional[str]]
+        position = start + 1
+        while position < end:
+            field_length, = _LENGTH.unpack_from(buffer, position)
+            position += _LENGTH.size
+            if field_length == _NONE:
+                fields.append(None)
+            else:
+                fields.append(str(buffer[position:position + field_length], 'utf-8'))
+                position += field_length
+        yield (OPS[buffer[start]], tuple(fields)), end
+        offset = end
+
+
+def segments(path: str) -> List[str]:
+    """
+    Segment files of a journal directory, in order
+    """
+    if not os.path.isdir(path):
+        return []
+    return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(SUFFIX)]
+
+
+def read(path: str) -> Iterator[Record]:
+    """
+    Stream the records of a journal directory, segments are memory mapped
+    """
+    for segment in segments(path):
+        for record, _ in _read_segment(segment):
+            yield record
+
+
+def _read_segment(segment: str) -> Iterator[Tuple[Record, int]]:
+    with open(segment, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                end = 0
+                for record, end in decode_records(view):
+                    yield record, end
+                if end < size:
+                    logger.warning('Ignoring %d bytes of incomplete records at the end of %s', size - end, segment)
+            finally:
+                view.release()
+
+
+class Journal:
+    """
+    Append-only segmented journal, pass it to the ingest `Client` to record every successful PUSH, POP and FLUSH.
+    Replay it with `Client.replay`
+    """
+
+    def __init__(
+        self, path: str, segment_size: int = 64 * 1024 * 1024, fsync: bool = False, fsync_interval: float = 1.0
+    ):
+        """
+        :param path: directory of the segment files, created if needed
+        :param segment_size: bytes after which a new segment file is started
+        :param fsync: sync records to disk, otherwise records are only safe from a crash of the process
+        :param fsync_interval: with `fsync`, minimum seconds between two syncs, the records of the last interval may
+        be lost on a power failure (0 to sync every record, `flush` syncs at once)
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self._synced = monotonic()
+        os.makedirs(path, exist_ok=True)
+        # an interrupted compaction: an incomplete one is dropped, the original segments are all there, a complete
+        # one replaces them
+        shutil.rmtree(os.path.join(path, COMPACTING), ignore_errors=True)
+        self._finish_compaction()
+        self._open()
+
+    def append(self, command: Command, args: Sequence[str], locale: str = None) -> None:
+        """
+        Record a command with its arguments, the locale of a PUSH is recorded too
+        """
+        fields = tuple(args) + (locale,) if command == Command.PUSH else tuple(args)
+        self._write(encode_record(command, fields))
+        self.records += 1
+
+    def segments(self) -> List[str]:
+        return segments(self.path)
+
+    def compact(self) -> int:
+        """
+        Rewrite the journal without the records of the objects, buckets and collections flushed later, and without the
+        flushes, returns the number of dropped records
+        """
+        self.close()
+        flushed = {}  # type: Dict[Tuple[Optional[str], ...], int]
+        for index, (command, fields) in enumerate(read(self.path)):
+            if command in FLUSHES:
+                flushed[fields] = index
+
+        # numbered after the current segments, so the ones already moved are told apart if the swap is interrupted
+        compacting = os.path.join(self.path, COMPACTING)
+        shutil.rmtree(compacting, ignore_errors=True)
+        os.makedirs(compacting)
+        open(os.path.join(compacting, os.path.basename(self._segment(self._index + 1))), 'wb').close()
+        with open(os.path.join(compacting, FIRST), 'w') as f:
+            f.write(str(self._index + 1))
+        compacted = Journal(compacting, self.segment_size, self.fsync, self.fsync_interval)
+        dropped = 0
+        for index, (command, fields) in enumerate(read(self.path)):
+            if command in FLUSHES or any(flushed.get(fields[:n], -1) > index for n in (1, 2, 3)):
+                dropped += 1
+                continue
+            compacted._write(encode_record(command, fields))
+        compacted.close()
+        os.replace(compacting, os.path.join(self.path, COMPACTED))
+        self._finish_compaction()
+        self._open()
+        return dropped
+
+    def flush(self) -> None:
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+            self._synced = monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def _open(self) -> None:
+        existing = self.segments()
+        if existing:
+            last = existing[-1]
+            self._index = _index(last)
+            end = 0
+            for _, end in _read_segment(last):
+                pass
+            if end < os.path.getsize(last):
+                # drop a record torn by a crash, new records are appended after the valid ones
+                os.truncate(last, end)
+        else:
+            self._index = 1
+        self._file = open(self._segment(self._index), 'ab')
+
+    def _write(self, data: bytes) -> None:
+        if self._file.tell() and self._file.tell() + len(data) > self.segment_size:
+            self.close()
+            self._index += 1
+            self._file = open(self._segment(self._index), 'ab')
+        self._file.write(data)
+        if self.fsync and monotonic() - self._synced >= self.fsync_interval:
+            self.flush()
+        else:
+            self._file.flush()
+
+    def _finish_compaction(self) -> None:
+        # every step can be repeated after a crash: the compacted segments are moved in first, then the superseded
+        # ones are removed, the marker goes last
+        compacted = os.path.join(self.path, COMPACTED)
+        if not os.path.isdir(compacted):
+            return
+        marker = os.path.join(compacted, FIRST)
+        if os.path.exists(marker):
+            with open(marker) as f:
+                first = int(f.read())
+            for segment in segments(compacted):
+                os.replace(segment, os.path.join(self.path, os.path.basename(segment)))
+            for segment in self.segments():
+                if _index(segment) < first:
+                    os.remove(segment)
+            os.remove(marker)
+        os.rmdir(compacted)
+
+    def _segment(self, index: int) -> str:
+        return os.path.join(self.path, f'{index:08d}{SUFFIX}')
+
+
+def _index(segment: str) -> int:
+    return int(os.path.basename(segment)[:-len(SUFFIX)])
@@ -0,0 +1,170 @@
+import asyncio
+from collections import deque
+from logging import getLogger
+from time import monotonic
+
+from typing import Callable, Deque, Dict, Optional
+
+from asonic.exceptions import BaseSonicException, Timeout
+
+Overloaded = Callable[[Dict[str, str]], bool]
+
+
+def latency_above(seconds: float) -> Overloaded:
+    """
+    `AdaptiveLimiter.monitor` check: the server is overloaded when INFO reports a worst command latency (in
+    milliseconds) above `seconds`
+    """
+    def overloaded(info: Dict[str, str]) -> bool:
+        return int(info.get('command_latency_worst', 0)) / 1000 > seconds
+    return overloaded
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of concurrent commands of a client and adapts the cap to the server health with additive
+    increase / multiplicative decrease: every successful command under the target latency grows the limit by
+    1 / limit (about +1 per round of `limit` commands), a slow or failed command (`ServerError`, `Timeout`) multiplies
+    it by `backoff`, at most once per round trip.
+    Without `target_latency`, the target is `tolerance` times the lowest latency observed
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        target_latency: float = None,
+        tolerance: float = 2.0,
+        backoff: float = 0.5,
+        clock: Callable[[], float] = monotonic
+    ):
+        """
+        :param initial_limit: concurrent commands allowed at first
+        :param min_limit: lowest limit, at least one command is always allowed
+        :param max_limit: highest limit, there is no point going over the pool max_connections
+        :param target_latency: seconds above which a command is considered slow
+        :param tolerance: without target_latency, multiple of the lowest observed latency considered slow
+        :param backoff: factor applied to the limit when the server is slow or failing
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.clock = clock
+        self.in_flight = 0
+        self.baseline = None  # type: Optional[float]
+        self.decreases = 0
+        self.logger = getLogger('adaptive_limiter')
+        self._waiters = deque()  # type: Deque[asyncio.Future]
+        self._last_decrease = None  # type: Optional[float]
+        self._monitor_task = None  # type: Optional[asyncio.Task]
+
+    def target(self) -> Optional[float]:
+        """
+        Latency above which a command is considered slow, None until one was observed
+        """
+        if self.target_latency is not None:
+            return self.target_latency
+        if self.baseline is None:
+            return None
+        return self.baseline * self.tolerance
+
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted just before the cancellation, give it back
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(future)
+            raise
+
+    def release(self, latency: Optional[float], error: bool = False) -> None:
+        """
+        Free the slot of a command and adapt the limit
+        :param latency: seconds the command took, None if it was cancelled
+        :param error: whether it failed in a way that may be caused by load
+        """
+        self.in_flight -= 1
+        if latency is not None:
+            self.observe(latency, error)
+        self._wake()
+
+    def observe(self, latency: float, error: bool = False) -> None:
+        target = self.target()
+        if error or (target is not None and latency > target):
+            self.decrease(latency)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        elif not error:
+            # let the baseline follow a lasting change of the server speed, slowly
+            self.baseline += (latency - self.baseline) * 0.01
+        self._wake()
+
+    def decrease(self, latency: float = 0.0) -> None:
+        """
+        Multiply the limit by `backoff`, unless it was already decreased in the last `latency` seconds: the
+        commands in flight at that time report the same congestion
+        """
+        now = self.clock()
+        if self._last_decrease is not None and now - self._last_decrease < latency:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self.decreases += 1
+
+    def monitor(self, control, overloaded: Overloaded, interval: float = 1.0) -> None:
+        """
+        Sample `info()` of a control channel client every `interval` seconds and decrease the limit when
+        `overloaded(info)` or when INFO timed out
+        :param control: `Client` of the control channel
+        :param overloaded: check of the INFO values, eg. `latency_above(0.05)`
+        """
+        self.stop()
+        self._monitor_task = asyncio.ensure_future(self._monitor(control, overloaded, interval))
+
+    def stop(self) -> None:
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            self._monitor_task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiters),
+            'decreases': self.decreases,
+        }
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    async def _monitor(self, control, overloaded: Overloaded, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                info = await control.info(timeout=interval)
+            except Timeout:
+                self.decrease()
+                continue
+            except (OSError, BaseSonicException) as e:
+                self.logger.warning('Failed to sample INFO: %r', e)
+                continue
+            if overloaded(info):
+                self.decrease()
@@ -0,0 +1,136 @@
+from bisect import bisect_left
+from weakref import WeakSet
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+# upper bounds of the latency histograms, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        (upper bound, number of values lower or equal) pairs, ending with +Inf
+        """
+        total = 0
+        result = []
+        for bound, count in zip([_format(b) for b in self.buckets] + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'sum': self.sum, 'buckets': dict(self.cumulative())}
+
+
+class Metrics:
+    """
+    Opt-in client metrics: per command latency histograms and error counts, time spent waiting for a pooled
+    connection, in use and idle connections and bytes on the wire.
+    Pass the same instance to every `Client` to be exported, metrics are labelled by channel.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.commands = {}  # type: Dict[Tuple[str, str], Histogram]
+        self.errors = {}  # type: Dict[Tuple[str, str, str], int]
+        self.pool_wait = {}  # type: Dict[str, Histogram]
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # open pools, a pool is removed when it is destroyed or garbage collected
+        self.pools = WeakSet()  # type: WeakSet[Any]
+
+    def observe_command(self, channel: str, command: str, seconds: float, error: BaseException = None) -> None:
+        histogram = self.commands.get((channel, command))
+        if histogram is None:
+            histogram = self.commands[(channel, command)] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        if error is not None:
+            key = (channel, command, type(error).__name__)
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def observe_pool_wait(self, channel: str, seconds: float) -> None:
+        histogram = self.pool_wait.get(channel)
+        if histogram is None:
+            histogram = self.pool_wait[channel] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def connections(self) -> Dict[str, Dict[str, int]]:
+        """
+        In use and idle connections of the open pools, by channel
+        """
+        result = {}  # type: Dict[str, Dict[str, int]]
+        for pool in self.pools:
+            if pool.closed:
+                continue
+            gauges = result.setdefault(pool.channel.value, {'in_use': 0, 'idle': 0})
+            for state, value in pool.stats().items():
+                gauges[state] += value
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        commands = {}  # type: Dict[str, Dict[str, Any]]
+        for (channel, command), histogram in self.commands.items():
+            commands.setdefault(channel, {})[command] = histogram.to_dict()
+        errors = {}  # type: Dict[str, Dict[str, Dict[str, int]]]
+        for (channel, command, error), count in self.errors.items():
+            errors.setdefault(channel, {}).setdefault(command, {})[error] = count
+        return {
+            'commands': commands,
+            'errors': errors,
+            'pool_wait': {channel: histogram.to_dict() for channel, histogram in self.pool_wait.items()},
+            'connections': self.connections(),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+        }
+
+    def to_prometheus(self, prefix: str = 'asonic') -> str:
+        """
+        Metrics in the Prometheus text exposition format
+        """
+        lines = []  # type: List[str]
+
+        def header(name: str, kind: str, description: str) -> None:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+
+        def histogram(name: str, labels: str, h: Histogram) -> None:
+            for bound, count in h.cumulative():
+                lines.append(f'{prefix}_{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{prefix}_{name}_sum{{{labels}}} {h.sum}')
+            lines.append(f'{prefix}_{name}_count{{{labels}}} {h.count}')
+
+        header('command_duration_seconds', 'histogram', 'Command latency, including the wait for a connection')
+        for (channel, command), h in sorted(self.commands.items()):
+            histogram('command_duration_seconds', f'channel="{channel}",command="{command}"', h)
+        header('command_errors_total', 'counter', 'Failed commands by exception')
+        for (channel, command, error), count in sorted(self.errors.items()):
+            lines.append(f'{prefix}_command_errors_total{{channel="{channel}",command="{command}",error="{error}"}} '
+                         f'{count}')
+        header('pool_wait_seconds', 'histogram', 'Time waiting for a pooled connection')
+        for channel, h in sorted(self.pool_wait.items()):
+            histogram('pool_wait_seconds', f'channel="{channel}"', h)
+        header('pool_connections', 'gauge', 'Pooled connections by state')
+        for channel, gauges in sorted(self.connections().items()):
+            for state, value in sorted(gauges.items()):
+                lines.append(f'{prefix}_pool_connections{{channel="{channel}",state="{state}"}} {value}')
+        header('read_bytes_total', 'counter', 'Bytes read from Sonic')
+        lines.append(f'{prefix}_read_bytes_total {self.bytes_read}')
+        header('written_bytes_total', 'counter', 'Bytes written to Sonic')
+        lines.append(f'{prefix}_written_bytes_total {self.bytes_written}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format(bound: float) -> str:
+    return repr(float(bound))
@@ -0,0 +1,178 @@
+"""
+Connection built on a raw `asyncio.Protocol` instead of streams: lines are framed in `data_received` and resolve the
+waiting futures directly, without a reader task, and writes go straight to the transport.
+Works with the default event loop and with uvloop, see `use_uvloop`.
+"""
+import asyncio
+from collections import deque
+
+from typing import Deque, Optional
+
+from asonic.connection import Connection
+from asonic.enums import Channel
+from asonic.exceptions import ConnectionClosed, ServerError
+from asonic.metrics import Metrics
+
+
+def use_uvloop() -> bool:
+    """
+    Make uvloop the event loop policy when it is installed, returns whether it is used
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+class SonicProtocol(asyncio.Protocol):
+    """
+    Splits the received bytes into lines and hands them to the connection
+    """
+
+    def __init__(self, connection: 'ProtocolConnection'):
+        self.connection = connection
+        self._buffer = bytearray()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.connection.transport = transport  # type: ignore
+
+    def data_received(self, data: bytes) -> None:
+        connection = self.connection
+        if connection.metrics is not None:
+            connection.metrics.bytes_read += len(data)
+        if self._buffer:
+            self._buffer += data
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        start = 0
+        end = data.find(b'\n')
+        while end != -1:
+            connection.line_received(data[start:end].strip())
+            start = end + 1
+            end = data.find(b'\n', start)
+        if start < len(data):
+            self._buffer += data[start:]
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.connection.connection_lost(exc)
+
+    def pause_writing(self) -> None:
+        self.connection.pause_writing()
+
+    def resume_writing(self) -> None:
+        self.connection.resume_writing()
+
+
+class ProtocolConnection(Connection):
+    """
+    `Connection` on an `asyncio.Protocol`.
+    Until `start_reader` is called, received lines are queued for `read`; afterwards they are matched to the callers
+    of `request` as soon as they are received
+    """
+
+    def __init__(self, host: str, port: int, channel: Channel, password: str, metrics: Metrics = None):
+        super().__init__(host, port, channel, password, metrics=metrics)
+        self.transport = None  # type: Optional[asyncio.Transport]
+        self._lines = deque()  # type: Deque[bytes]
+        self._line_waiter = None  # type: Optional[asyncio.Future]
+        self._drain_waiter = None  # type: Optional[asyncio.Future]
+        self._error = None  # type: Optional[Exception]
+        self._reading = False
+
+    async def connect(self) -> None:
+        loop = asyncio.get_event_loop()
+        await loop.create_connection(lambda: SonicProtocol(self), self.host, self.port)
+        await self._handshake()
+
+    async def write(self, msg: str) -> None:
+        assert self.transport is not None, 'connect'
+        self.logger.debug('>%s', msg)
+        data = (msg + '\r\n').encode()
+        if self.metrics is not None:
+            self.metrics.bytes_written += len(data)
+        self.transport.write(data)
+        if self._drain_waiter is not None:
+            # the transport buffer is full, wait until the server reads
+            await self._drain_waiter
+
+    async def read(self) -> bytes:
+        if self._lines:
+            line = self._lines.popleft()
+        else:
+            if self._error is not None:
+                raise self._error
+            self._line_waiter = asyncio.get_event_loop().create_future()
+            try:
+                line = await self._line_waiter
+            finally:
+                self._line_waiter = None
+        if line.startswith(b'ERR '):
+            raise ServerError(line[4:])
+        return line
+
+    @property
+    def reading(self) -> bool:
+        return self._reading and self._error is None
+
+    @property
+    def closed(self) -> bool:
+        if self.transport is None:
+            return False
+        return self._error is not None or self.transport.is_closing()
+
+    def start_reader(self) -> None:
+        assert self.transport is not None, 'connect'
+        self._reading = True
+        while self._lines:
+            self._dispatch(self._lines.popleft())
+
+    def line_received(self, line: bytes) -> None:
+        self.logger.debug('<%s', line)
+        if self._reading:
+            self._dispatch(line)
+        elif self._line_waiter is not None and not self._line_waiter.done():
+            self._line_waiter.set_result(line)
+        else:
+            self._lines.append(line)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if exc is None:
+            self._error = ConnectionClosed('Connection closed by server')
+        else:
+            self._error = ConnectionClosed(f'Connection lost: {exc!r}')
+        if self._line_waiter is not None and not self._line_waiter.done():
+            self._line_waiter.set_exception(self._error)
+        self._fail_all(self._error)
+        self.resume_writing()
+
+    def pause_writing(self) -> None:
+        if self._drain_waiter is None:
+            self._drain_waiter = asyncio.get_event_loop().create_future()
+
+    def resume_writing(self) -> None:
+        if self._drain_waiter is not None:
+            if not self._drain_waiter.done():
+                self._drain_waiter.set_result(None)
+            self._drain_waiter = None
+
+    def _write_blocked(self) -> bool:
+        return self._drain_waiter is not None
+
+    def _drained(self) -> asyncio.Future:
+        assert self._drain_waiter is not None
+        return self._drain_waiter
+
+    def _flush(self) -> None:
+        assert self.transport is not None
+        data = b''.join(self._write_buffer)
+        self._write_buffer.clear()
+        if self.metrics is not None:
+            self.metrics.bytes_written += len(data)
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+    async def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
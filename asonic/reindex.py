@@ -0,0 +1,222 @@
+"""
+Incremental re-indexing: a fingerprint and the words of every pushed object are kept in a local store, so syncing an
+object again only sends the difference to Sonic (nothing if its text did not change)::
+
+    reindexer = Reindexer(ingest, SqliteStore('index.sqlite'))
+    await reindexer.sync('messages', 'user1', 'message1', text)
+"""
+import dbm
+from abc import ABC, abstractmethod
+import json
+import re
+import sqlite3
+from hashlib import blake2b
+
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, Optional, Tuple
+
+from asonic.client import Client, Records, run_many
+
+Key = Tuple[str, str, str]
+Entry = Tuple[str, FrozenSet[str]]
+
+UNCHANGED = 'unchanged'
+PUSHED = 'pushed'
+UPDATED = 'updated'
+
+_WORD = re.compile(r'\w+')
+
+
+def words(text: str) -> FrozenSet[str]:
+    """
+    Lowercased words of a text
+    """
+    return frozenset(_WORD.findall(text.lower()))
+
+
+def fingerprint(text: str, locale: str = None) -> str:
+    return blake2b(f'{locale or ""}\0{text}'.encode(), digest_size=16).hexdigest()
+
+
+class Store(ABC):
+    """
+    Fingerprint and words of the indexed objects, by (collection, bucket, object)
+    """
+
+    @abstractmethod
+    def get(self, key: Key) -> Optional[Entry]:
+        pass
+
+    @abstractmethod
+    def set(self, key: Key, entry: Entry) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: Key) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStore(Store):
+    def __init__(self):
+        self.entries = {}  # type: Dict[Key, Entry]
+
+    def get(self, key: Key) -> Optional[Entry]:
+        return self.entries.get(key)
+
+    def set(self, key: Key, entry: Entry) -> None:
+        self.entries[key] = entry
+
+    def delete(self, key: Key) -> None:
+        self.entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class DbmStore(Store):
+    """
+    Store in a `dbm` database file
+    """
+
+    def __init__(self, path: str):
+        self.db = dbm.open(path, 'c')
+
+    def get(self, key: Key) -> Optional[Entry]:
+        value = self.db.get(_encode_key(key))
+        if value is None:
+            return None
+        digest, object_words = json.loads(value)
+        return digest, frozenset(object_words)
+
+    def set(self, key: Key, entry: Entry) -> None:
+        self.db[_encode_key(key)] = json.dumps([entry[0], sorted(entry[1])])
+
+    def delete(self, key: Key) -> None:
+        try:
+            del self.db[_encode_key(key)]
+        except KeyError:
+            pass
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class SqliteStore(Store):
+    """
+    Store in a SQLite database file
+    """
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS objects ('
+            'collection TEXT, bucket TEXT, object TEXT, fingerprint TEXT, words TEXT, '
+            'PRIMARY KEY (collection, bucket, object))'
+        )
+
+    def get(self, key: Key) -> Optional[Entry]:
+        row = self.db.execute(
+            'SELECT fingerprint, words FROM objects WHERE collection = ? AND bucket = ? AND object = ?', key
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], frozenset(json.loads(row[1]))
+
+    def set(self, key: Key, entry: Entry) -> None:
+        self.db.execute(
+            'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)', key + (entry[0], json.dumps(sorted(entry[1])))
+        )
+
+    def delete(self, key: Key) -> None:
+        self.db.execute('DELETE FROM objects WHERE collection = ? AND bucket = ? AND object = ?', key)
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class Reindexer:
+    """
+    Push objects through an ingest client, sending only what changed since their last sync:
+    unchanged objects are skipped, for changed ones only the new words are pushed and the removed words popped.
+    The store is updated once Sonic accepted the changes, so a failed sync is retried in full next time
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        store: Store = None,
+        tokenize: Callable[[str], FrozenSet[str]] = words,
+        flush_unknown: bool = False
+    ):
+        """
+        :param client: client of the ingest channel
+        :param store: where fingerprints and words are kept (default: in memory)
+        :param tokenize: words of a text, as compared between syncs
+        :param flush_unknown: flush objects missing from the store before their first push, in case Sonic already
+        has stale words for them (eg. the store is new or was lost)
+        """
+        self.client = client
+        self.store = MemoryStore() if store is None else store
+        self.tokenize = tokenize
+        self.flush_unknown = flush_unknown
+        self.stats = {UNCHANGED: 0, PUSHED: 0, UPDATED: 0, 'words_pushed': 0, 'words_popped': 0, 'removed': 0}
+
+    async def sync(self, collection: str, bucket: str, obj: str, text: str, locale: str = None) -> str:
+        """
+        Index the current text of an object, returns `unchanged`, `pushed` (first sync) or `updated`
+        """
+        key = (collection, bucket, obj)
+        digest = fingerprint(text, locale)
+        entry = self.store.get(key)
+        if entry is not None and entry[0] == digest:
+            self.stats[UNCHANGED] += 1
+            return UNCHANGED
+        new_words = self.tokenize(text)
+
+        if entry is None:
+            if self.flush_unknown:
+                await self.client.flusho(collection, bucket, obj)
+            # the whole text gives Sonic more context to detect its language
+            await self.client.push(collection, bucket, obj, text, locale=locale)
+            self.store.set(key, (digest, new_words))
+            self.stats[PUSHED] += 1
+            self.stats['words_pushed'] += len(new_words)
+            return PUSHED
+
+        added = new_words - entry[1]
+        removed = entry[1] - new_words
+        # push first so the object stays searchable by its unchanged words at any time
+        if added:
+            await self.client.push(collection, bucket, obj, ' '.join(sorted(added)), locale=locale)
+        if removed:
+            await self.client.pop(collection, bucket, obj, ' '.join(sorted(removed)))
+        self.store.set(key, (digest, new_words))
+        self.stats[UPDATED] += 1
+        self.stats['words_pushed'] += len(added)
+        self.stats['words_popped'] += len(removed)
+        return UPDATED
+
+    async def remove(self, collection: str, bucket: str, obj: str) -> int:
+        """
+        Flush an object from Sonic and forget it
+        """
+        result = await self.client.flusho(collection, bucket, obj)
+        self.store.delete((collection, bucket, obj))
+        self.stats['removed'] += 1
+        return result
+
+    def sync_many(self, records: Records, concurrency: int = None) -> AsyncIterator[Tuple[Tuple, Any]]:
+        """
+        Sync many objects concurrently, see `Client.push_many`
+        :param records: iterable or async iterable of (collection, bucket, object, text[, locale]) tuples
+        :param concurrency: maximum number of records in flight (default: max_connections of the client)
+        """
+        return run_many(self.sync, records, concurrency or self.client.max_connections)
+
+
+def _encode_key(key: Key) -> bytes:
+    return '\0'.join(key).encode()
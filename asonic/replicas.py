@@ -0,0 +1,209 @@
+import asyncio
+from collections import deque
+from random import random
+from time import monotonic
+
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from asonic.client import Client
+from asonic.enums import Channel
+from asonic.exceptions import ClientError
+from asonic.sharding import Node, parse_node
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY = 'latency'
+
+
+class Replica:
+    """
+    A replica endpoint and the load and latency seen by the client
+    """
+
+    def __init__(self, name: str, client: Client, decay: float = 0.2):
+        self.name = name
+        self.client = client
+        self.decay = decay
+        self.outstanding = 0
+        self.latency = None  # type: Optional[float]
+        self.requests = 0
+        self.errors = 0
+
+    def observe(self, seconds: float) -> None:
+        # exponentially weighted moving average, so a replica that slows down (eg. consolidating) is noticed quickly
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.decay * (seconds - self.latency)
+
+    def score(self, strategy: str) -> float:
+        if strategy == LEAST_OUTSTANDING:
+            return self.outstanding
+        # replicas never measured are tried first
+        return (self.latency or 0.0) * (self.outstanding + 1)
+
+
+class ReplicaClient:
+    """
+    Search client spreading QUERY, SUGGEST and LIST over replicas of the same index.
+    Every command goes to the replica with the fewest commands in flight (`least_outstanding`) or the lowest
+    latency weighted by its commands in flight (`latency`).
+    With `hedge_percentile`, a command still running after that percentile of the recent latencies is sent again to
+    another replica, the first reply wins and the other command is cancelled
+    (without multiplex, the connection of a cancelled command is closed)
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, Client],
+        strategy: str = LEAST_OUTSTANDING,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.001,
+        window: int = 1000,
+        decay: float = 0.2
+    ):
+        """
+        :param clients: search client of each replica, by replica name
+        :param strategy: `least_outstanding` or `latency`
+        :param hedge_percentile: latency percentile (eg. 0.95) after which a command is hedged, no hedging if None
+        :param hedge_min_samples: number of latencies measured before hedging starts
+        :param hedge_min_delay: minimum seconds before hedging, so fast commands are never sent twice
+        :param window: number of recent latencies the percentile is computed on
+        :param decay: weight of a new latency in the moving average of a replica
+        """
+        if strategy not in (LEAST_OUTSTANDING, LATENCY):
+            raise ClientError(f'Unknown strategy {strategy}')
+        if not clients:
+            raise ClientError('No replica')
+        self.replicas = [Replica(name, client, decay) for name, client in clients.items()]
+        self.strategy = strategy
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = deque(maxlen=window)  # type: Deque[float]
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    async def create(
+        cls,
+        nodes: Iterable[Node],
+        strategy: str = LEAST_OUTSTANDING,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.001,
+        window: int = 1000,
+        decay: float = 0.2,
+        **kwargs
+    ) -> 'ReplicaClient':
+        """
+        Connect to every replica, see `ReplicaClient` for the routing and hedging arguments
+        :param nodes: `host:port` strings or (host, port) tuples
+        :param kwargs: arguments of `Client.create` shared by every replica (password, multiplex, etc.)
+        """
+        addresses = [node if isinstance(node, tuple) else parse_node(node) for node in nodes]
+        clients = await asyncio.gather(*(
+            Client.create(host=host, port=port, channel=Channel.SEARCH, **kwargs) for host, port in addresses
+        ))
+        return cls(
+            {f'{host}:{port}': client for (host, port), client in zip(addresses, clients)},
+            strategy=strategy,
+            hedge_percentile=hedge_percentile,
+            hedge_min_samples=hedge_min_samples,
+            hedge_min_delay=hedge_min_delay,
+            window=window,
+            decay=decay
+        )
+
+    async def query(
+        self, collection: str, bucket: str, terms: str, limit: int = None, offset: int = None, locale: str = None
+    ) -> List[bytes]:
+        return await self._call('query', collection, bucket, terms, limit=limit, offset=offset, locale=locale)
+
+    async def suggest(self, collection: str, bucket: str, word: str, limit: int = None) -> List[bytes]:
+        return await self._call('suggest', collection, bucket, word, limit=limit)
+
+    async def list(self, collection: str, bucket: str = None, limit: int = None, offset: int = None) -> List[bytes]:
+        return await self._call('list', collection, bucket, limit=limit, offset=offset)
+
+    async def ping(self) -> List[bytes]:
+        return await asyncio.gather(*(replica.client.ping() for replica in self.replicas))
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds after which a command is hedged, None while hedging is disabled
+        """
+        if self.hedge_percentile is None or len(self.replicas) < 2 or len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))
+        return max(self.hedge_min_delay, ordered[index])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'replicas': {
+                replica.name: {
+                    'outstanding': replica.outstanding,
+                    'latency': replica.latency,
+                    'requests': replica.requests,
+                    'errors': replica.errors,
+                } for replica in self.replicas
+            },
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+        }
+
+    def _select(self, exclude: Replica = None) -> Replica:
+        candidates = [replica for replica in self.replicas if replica is not exclude]
+        # random tie break so idle replicas share the load
+        return min(candidates, key=lambda replica: (replica.score(self.strategy), random()))
+
+    def _start(self, replica: Replica, method: str, *args, **kwargs) -> asyncio.Future:
+        # counted as soon as it is scheduled so concurrent callers see it
+        replica.outstanding += 1
+        replica.requests += 1
+        start = monotonic()
+        task = asyncio.ensure_future(getattr(replica.client, method)(*args, **kwargs))
+        task.add_done_callback(lambda t: self._done(replica, start, t))
+        return task
+
+    def _done(self, replica: Replica, start: float, task: asyncio.Future) -> None:
+        replica.outstanding -= 1
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            replica.errors += 1
+            return
+        elapsed = monotonic() - start
+        replica.observe(elapsed)
+        self.latencies.append(elapsed)
+
+    async def _call(self, method: str, *args, **kwargs) -> Any:
+        primary = self._select()
+        delay = self.hedge_delay()
+        first = self._start(primary, method, *args, **kwargs)
+        if delay is None:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            self.hedged += 1
+            tasks.add(self._start(self._select(exclude=primary), method, *args, **kwargs))
+            error = None  # type: Optional[BaseException]
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                failed = [task for task in done if task.exception() is not None]
+                error = error or (failed[0].exception() if failed else None)
+                for task in done:
+                    if task not in failed:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
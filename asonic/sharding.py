@@ -0,0 +1,206 @@
+import asyncio
+from bisect import bisect
+from hashlib import md5
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from asonic.client import Client, merge
+from asonic.enums import Action, Channel
+from asonic.exceptions import ClientError
+
+# number of results Sonic returns when no limit is given (query_limit_default)
+DEFAULT_LIMIT = 10
+
+KeyFunction = Callable[[str, Optional[str]], Optional[str]]
+Node = Union[str, Tuple[str, int]]
+
+
+def bucket_key(collection: str, bucket: Optional[str]) -> Optional[str]:
+    """
+    Default shard key: collection and bucket, unknown when the bucket is not set
+    """
+    if bucket is None:
+        return None
+    return f'{collection}:{bucket}'
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing ring: every node owns `vnodes` points of the ring and a key belongs to the node of the next
+    point, so adding or removing one of N nodes only moves about 1/N of the keys
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self._points = []  # type: List[int]
+        self._owners = []  # type: List[str]
+        self.nodes = []  # type: List[str]
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            raise ClientError(f'Node {node} is already in the ring')
+        self.nodes.append(node)
+        self._build()
+
+    def remove(self, node: str) -> None:
+        self.nodes.remove(node)
+        self._build()
+
+    def get(self, key: str) -> str:
+        if not self._points:
+            raise ClientError('No node in the ring')
+        index = bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+    def _build(self) -> None:
+        ring = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+
+class ShardedClient:
+    """
+    Client spreading an index over several Sonic nodes, each with its own `Client` and connection pool.
+    Commands are routed to the node owning `key(collection, bucket)` on a consistent hashing ring.
+    QUERY, SUGGEST and LIST are sent to every node and merged when the key is unknown (eg. no bucket),
+    writes without a key are sent to every node except PUSH which is rejected
+    """
+
+    def __init__(self, clients: Dict[str, Client], key: KeyFunction = bucket_key, vnodes: int = 160):
+        """
+        :param clients: client of each node, by node name
+        :param key: shard key of a collection and a bucket, None if it can't be known
+        :param vnodes: number of points of each node on the ring
+        """
+        self.clients = dict(clients)
+        self.key = key
+        self.ring = HashRing(self.clients, vnodes=vnodes)
+
+    @classmethod
+    async def create(
+        cls,
+        nodes: Iterable[Node],
+        channel: Channel = Channel.SEARCH,
+        key: KeyFunction = bucket_key,
+        vnodes: int = 160,
+        **kwargs
+    ) -> 'ShardedClient':
+        """
+        Connect to every node
+        :param nodes: `host:port` strings or (host, port) tuples
+        :param channel: channel of the clients
+        :param key: shard key of a collection and a bucket, None if it can't be known
+        :param vnodes: number of points of each node on the ring
+        :param kwargs: arguments of `Client.create` shared by every node (password, max_connections, etc.)
+        """
+        addresses = [node if isinstance(node, tuple) else parse_node(node) for node in nodes]
+        clients = await asyncio.gather(*(
+            Client.create(host=host, port=port, channel=channel, **kwargs) for host, port in addresses
+        ))
+        return cls({f'{host}:{port}': client for (host, port), client in zip(addresses, clients)}, key, vnodes)
+
+    def add_node(self, name: str, client: Client) -> None:
+        """
+        Add a node, only the keys now owned by it move to it (their data has to be pushed again)
+        """
+        self.clients[name] = client
+        self.ring.add(name)
+
+    def client_for(self, collection: str, bucket: str = None) -> Optional[Client]:
+        """
+        Client of the node owning a bucket, None if the shard key is unknown
+        """
+        key = self.key(collection, bucket)
+        if key is None:
+            return None
+        return self.clients[self.ring.get(key)]
+
+    async def query(
+        self, collection: str, bucket: str, terms: str, limit: int = None, offset: int = None, locale: str = None
+    ) -> List[bytes]:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.query(collection, bucket, terms, limit=limit, offset=offset, locale=locale)
+        results = await self._all(
+            'query', collection, bucket, terms, limit=self._fetch(limit, offset), offset=None, locale=locale
+        )
+        return merge(results, limit or DEFAULT_LIMIT, offset)
+
+    async def suggest(self, collection: str, bucket: str, word: str, limit: int = None) -> List[bytes]:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.suggest(collection, bucket, word, limit=limit)
+        return merge(await self._all('suggest', collection, bucket, word, limit=limit), limit)
+
+    async def list(self, collection: str, bucket: str = None, limit: int = None, offset: int = None) -> List[bytes]:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.list(collection, bucket, limit=limit, offset=offset)
+        results = await self._all('list', collection, bucket, limit=self._fetch(limit, offset), offset=None)
+        return merge(results, limit or DEFAULT_LIMIT, offset)
+
+    async def push(self, collection: str, bucket: str, obj: str, text: str, locale: str = None) -> bytes:
+        client = self.client_for(collection, bucket)
+        if client is None:
+            raise ClientError(f'No shard key for {collection} {bucket}')
+        return await client.push(collection, bucket, obj, text, locale=locale)
+
+    async def pop(self, collection: str, bucket: str, obj: str, text: str) -> int:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.pop(collection, bucket, obj, text)
+        return sum(await self._all('pop', collection, bucket, obj, text))
+
+    async def flusho(self, collection: str, bucket: str, obj: str) -> int:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.flusho(collection, bucket, obj)
+        return sum(await self._all('flusho', collection, bucket, obj))
+
+    async def flushb(self, collection: str, bucket: str) -> int:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.flushb(collection, bucket)
+        return sum(await self._all('flushb', collection, bucket))
+
+    async def flushc(self, collection: str) -> int:
+        return sum(await self._all('flushc', collection))
+
+    async def count(self, collection: str, bucket: str = None, obj: str = None) -> int:
+        client = self.client_for(collection, bucket)
+        if client is not None:
+            return await client.count(collection, bucket, obj)
+        return sum(await self._all('count', collection, bucket, obj))
+
+    async def ping(self) -> List[bytes]:
+        return await self._all('ping')
+
+    async def trigger(self, action: Action = None) -> List[bytes]:
+        return await self._all('trigger', action)
+
+    async def info(self) -> Dict[str, Dict]:
+        return dict(zip(self.clients, await self._all('info')))
+
+    async def _all(self, method: str, *args, **kwargs) -> List[Any]:
+        return await asyncio.gather(*(getattr(client, method)(*args, **kwargs) for client in self.clients.values()))
+
+    @staticmethod
+    def _fetch(limit: Optional[int], offset: Optional[int]) -> Optional[int]:
+        # every node has to return the results up to the requested page
+        if not offset:
+            return limit
+        return offset + (limit or DEFAULT_LIMIT)
+
+
+def parse_node(node: str) -> Tuple[str, int]:
+    """
+    Split a `host:port` node address
+    """
+    host, _, port = node.rpartition(':')
+    return host, int(port)
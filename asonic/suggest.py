@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from time import monotonic
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from asonic.codec import BYTES, Item
+
+# number of words Sonic suggests when no limit is given (suggest_limit_default)
+DEFAULT_SUGGEST_LIMIT = 5
+
+
+class _Node:
+    __slots__ = ('parent', 'char', 'children', 'entry')
+
+    def __init__(self, parent: Optional['_Node'] = None, char: str = ''):
+        self.parent = parent
+        self.char = char
+        self.children = {}  # type: Dict[str, _Node]
+        # (expires, limit asked, words)
+        self.entry = None  # type: Optional[Tuple[float, int, Tuple[Item, ...]]]
+
+
+class SuggestCache:
+    """
+    Typeahead accelerator: recent SUGGEST (and LIST) results are kept in a prefix trie per (collection, bucket, result
+    type).
+    A result shorter than the limit it was asked with holds every word starting with its prefix, so longer prefixes
+    are answered locally by filtering it, without a round trip ("comm" -> "comma").
+    Share one instance with the ingest and control clients of the process so their commands invalidate it, like
+    `ResultCache`.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0, clock: Callable[[], float] = monotonic):
+        """
+        :param max_size: maximum number of cached prefixes, the least recently used one is evicted first
+        :param ttl: seconds a result is used (Sonic consolidates new words on its own, every 30 seconds by default)
+        :param clock: time source, in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._tries = {}  # type: Dict[Tuple[str, str, str], _Node]
+        self._lru = OrderedDict()  # type: OrderedDict[Tuple[str, str, str, str], _Node]
+        self._generation = 0
+        self._invalidated = {}  # type: Dict[Tuple[str, Optional[str]], int]
+        self._cleared = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def generation(self) -> int:
+        """
+        Current invalidation generation, to be passed to `set` for a result fetched from now on
+        """
+        return self._generation
+
+    def get(
+        self, collection: str, bucket: str, prefix: str, limit: int = None, result_type: str = BYTES
+    ) -> Optional[List[Item]]:
+        """
+        Suggestions for a prefix, from the result of this prefix or of a shorter one, None if they are not known
+        :param result_type: type of the words, results are cached separately for each one
+        """
+        limit = limit or DEFAULT_SUGGEST_LIMIT
+        prefix = prefix.lower()
+        node = self._tries.get((collection, bucket, result_type))
+        found = None  # type: Optional[Tuple[_Node, int]]
+        depth = 0
+        now = self.clock()
+        while node is not None:
+            entry = node.entry
+            if entry is not None and entry[0] > now:
+                expires, asked, words = entry
+                if len(words) < asked or (depth == len(prefix) and limit <= asked):
+                    found = (node, depth)
+            if depth == len(prefix):
+                break
+            node = node.children.get(prefix[depth])
+            depth += 1
+        if found is None:
+            self.misses += 1
+            return None
+        node, depth = found
+        assert node.entry is not None
+        self._lru.move_to_end((collection, bucket, result_type, prefix[:depth]))
+        words = node.entry[2]
+        if depth == len(prefix):
+            self.hits += 1
+            return list(words[:limit])
+        self.local_hits += 1
+        return [word for word in words if _startswith(word, prefix)][:limit]
+
+    def set(
+        self,
+        collection: str,
+        bucket: str,
+        prefix: str,
+        limit: Optional[int],
+        words: List[Item],
+        generation: int,
+        result_type: str = BYTES
+    ) -> None:
+        """
+        Store the result of a SUGGEST, or of a LIST with an empty prefix
+        :param limit: limit the result was asked with
+        :param generation: `generation()` from before the command was sent
+        :param result_type: type of the words
+        """
+        if generation < max(
+            self._cleared, self._invalidated.get((collection, None), 0), self._invalidated.get((collection, bucket), 0)
+        ):
+            return
+        prefix = prefix.lower()
+        node = self._tries.get((collection, bucket, result_type))
+        if node is None:
+            node = self._tries[(collection, bucket, result_type)] = _Node()
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node(node, char)
+            node = child
+        node.entry = (self.clock() + self.ttl, limit or DEFAULT_SUGGEST_LIMIT, tuple(words))
+        key = (collection, bucket, result_type, prefix)
+        self._lru[key] = node
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._evict(*self._lru.popitem(last=False))
+            self.evictions += 1
+
+    def invalidate(self, collection: str = None, bucket: str = None) -> None:
+        """
+        Drop cached suggestions
+        :param collection: collection to invalidate, everything if not set
+        :param bucket: bucket to invalidate, the whole collection if not set
+        """
+        self._generation += 1
+        self.invalidations += 1
+        if collection is None:
+            self._cleared = self._generation
+            self._tries.clear()
+            self._lru.clear()
+            self._invalidated.clear()
+            return
+        self._invalidated[(collection, bucket)] = self._generation
+        for key in [key for key in self._tries if key[0] == collection and bucket in (None, key[1])]:
+            del self._tries[key]
+        for key in [key for key in self._lru if key[0] == collection and bucket in (None, key[1])]:
+            del self._lru[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._lru),
+            'hits': self.hits,
+            'local_hits': self.local_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _evict(self, key: Tuple[str, str, str, str], node: _Node) -> None:
+        node.entry = None
+        # prune the branch up to the closest node still in use
+        while node.parent is not None and node.entry is None and not node.children:
+            del node.parent.children[node.char]
+            node = node.parent
+        if node.parent is None and node.entry is None and not node.children:
+            self._tries.pop(key[:3], None)
+
+
+def _startswith(word: Item, prefix: str) -> bool:
+    if isinstance(word, str):
+        return word.lower().startswith(prefix)
+    # bytes.lower only handles ASCII
+    return word.decode(errors='ignore').lower().startswith(prefix)
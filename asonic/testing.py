@@ -0,0 +1,347 @@
+"""
+In-process asyncio server speaking the Sonic channel protocol, to test and benchmark the client without a Sonic
+instance::
+
+    async with FakeSonic(port=0) as server:
+        client = await Client.create(host=server.host, port=server.port)
+
+The index is a plain in-memory inverted index: words are lowercased, split on non word characters and a short
+list of English stopwords is dropped. QUERY, SUGGEST and LIST reply `PENDING <marker>` at once and send their
+`EVENT` after the injected latency, so events of a connection may arrive out of order.
+"""
+import asyncio
+import random
+import re
+from itertools import count
+
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from asonic.enums import Channel, Command, event_commands
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is', 'it', 'of', 'on',
+    'or', 'over', 'such', 'that', 'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was', 'will',
+    'with',
+))
+
+_WORD = re.compile(r'\w+')
+_TEXT = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_OPTION = re.compile(r'(LIMIT|OFFSET|LANG)\(([^)]*)\)')
+_MARKER_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+# commands of each channel, as listed by HELP
+CHANNEL_COMMANDS = {
+    Channel.SEARCH: (Command.QUERY, Command.SUGGEST, Command.LIST, Command.PING, Command.HELP, Command.QUIT),
+    Channel.INGEST: (
+        Command.PUSH, Command.POP, Command.COUNT, Command.FLUSHC, Command.FLUSHB, Command.FLUSHO, Command.PING,
+        Command.HELP, Command.QUIT,
+    ),
+    Channel.CONTROL: (Command.TRIGGER, Command.INFO, Command.PING, Command.HELP, Command.QUIT),
+}
+
+Latency = Union[float, Callable[[Command], float]]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Unique words of a text, in order
+    """
+    words = {}  # type: Dict[str, None]
+    for word in _WORD.findall(text.lower()):
+        if word not in STOPWORDS:
+            words[word] = None
+    return list(words)
+
+
+class Index:
+    """
+    In-memory inverted index of collection -> bucket -> object -> words
+    """
+
+    def __init__(self):
+        self._sequence = count()
+        # (collection, bucket) -> object -> (last push sequence, words)
+        self._objects = {}  # type: Dict[Tuple[str, str], Dict[str, Tuple[int, Set[str]]]]
+        # (collection, bucket) -> word -> objects
+        self._words = {}  # type: Dict[Tuple[str, str], Dict[str, Set[str]]]
+
+    def push(self, collection: str, bucket: str, obj: str, text: str) -> None:
+        objects = self._objects.setdefault((collection, bucket), {})
+        words = self._words.setdefault((collection, bucket), {})
+        _, object_words = objects.get(obj, (0, set()))
+        for word in tokenize(text):
+            object_words.add(word)
+            words.setdefault(word, set()).add(obj)
+        objects[obj] = (next(self._sequence), object_words)
+
+    def pop(self, collection: str, bucket: str, obj: str, text: str) -> int:
+        _, object_words = self._objects.get((collection, bucket), {}).get(obj, (0, set()))
+        removed = [word for word in tokenize(text) if word in object_words]
+        for word in removed:
+            self._unlink(collection, bucket, obj, word)
+            object_words.discard(word)
+        return len(removed)
+
+    def query(self, collection: str, bucket: str, text: str) -> List[str]:
+        words = self._words.get((collection, bucket), {})
+        objects = self._objects.get((collection, bucket), {})
+        terms = tokenize(text)
+        if not terms:
+            return []
+        found = set.intersection(*(words.get(term, set()) for term in terms))
+        # most recently pushed first
+        return sorted(found, key=lambda obj: objects[obj][0], reverse=True)
+
+    def suggest(self, collection: str, bucket: str, prefix: str) -> List[str]:
+        prefix = prefix.lower()
+        return [word for word in self.list(collection, bucket) if word.startswith(prefix)]
+
+    def list(self, collection: str, bucket: str) -> List[str]:
+        return sorted(word for word, objects in self._words.get((collection, bucket), {}).items() if objects)
+
+    def count(self, collection: str, bucket: str = None, obj: str = None) -> int:
+        if bucket is None:
+            return sum(1 for key in self._objects if key[0] == collection)
+        if obj is None:
+            return len(self.list(collection, bucket))
+        return len(self._objects.get((collection, bucket), {}).get(obj, (0, ()))[1])
+
+    def flushc(self, collection: str) -> int:
+        buckets = [key for key in self._objects if key[0] == collection]
+        for key in buckets:
+            del self._objects[key]
+            self._words.pop(key, None)
+        return 1 if buckets else 0
+
+    def flushb(self, collection: str, bucket: str) -> int:
+        self._words.pop((collection, bucket), None)
+        return 1 if self._objects.pop((collection, bucket), None) is not None else 0
+
+    def flusho(self, collection: str, bucket: str, obj: str) -> int:
+        _, object_words = self._objects.get((collection, bucket), {}).pop(obj, (0, set()))
+        for word in object_words:
+            self._unlink(collection, bucket, obj, word)
+        return len(object_words)
+
+    def _unlink(self, collection: str, bucket: str, obj: str, word: str) -> None:
+        objects = self._words[(collection, bucket)][word]
+        objects.discard(obj)
+        if not objects:
+            del self._words[(collection, bucket)][word]
+
+
+class FakeSonic:
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 1491,
+        password: str = 'SecretPassword',
+        buffer: int = 20000,
+        latency: Latency = 0.0,
+        error_rate: float = 0.0,
+        disconnect_rate: float = 0.0,
+        seed: int = None
+    ):
+        """
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port (see `port` once started)
+        :param password: channel password
+        :param buffer: buffer size announced in `STARTED`, longer lines are rejected with `ERR buffer_overflow`
+        :param latency: seconds every command takes, or a function of the command returning them
+        :param error_rate: probability of replying `ERR injected_failure` to a command
+        :param disconnect_rate: probability of closing the connection instead of replying to a command
+        :param seed: seed of the random failures
+        """
+        self.host = host
+        self.port = port
+        self.password = password
+        self.buffer = buffer
+        self.latency = latency
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.index = Index()
+
+        # number of connections accepted and of commands received, by command
+        self.connections = 0
+        self.commands = {}  # type: Dict[str, int]
+
+        self._random = random.Random(seed)
+        self._markers = count()
+        self._server = None  # type: Optional[asyncio.AbstractServer]
+        self._clients = set()  # type: Set[asyncio.StreamWriter]
+
+    async def start(self) -> 'FakeSonic':
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=self.buffer * 2)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> 'FakeSonic':
+        return await self.start()
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._clients.add(writer)
+        tasks = set()  # type: Set[asyncio.Future]
+        try:
+            writer.write(b'CONNECTED <sonic-server v1.4.9>\r\n')
+            channel = await self._start(reader, writer)
+            while channel is not None:
+                line = await self._readline(reader, writer)
+                if line is None:
+                    break
+                if not line:
+                    continue
+                command, _, arguments = line.partition(' ')
+                self.commands[command] = self.commands.get(command, 0) + 1
+                if self._random.random() < self.disconnect_rate:
+                    break
+                if self._random.random() < self.error_rate:
+                    writer.write(b'ERR injected_failure\r\n')
+                    continue
+                try:
+                    cmd = Command(command)
+                except ValueError:
+                    cmd = None
+                if cmd is None or cmd not in CHANNEL_COMMANDS[channel]:
+                    writer.write(b'ERR unknown_command\r\n')
+                    continue
+                if cmd in event_commands:
+                    marker = self._marker()
+                    writer.write(f'PENDING {marker}\r\n'.encode())
+                    task = asyncio.ensure_future(self._event(writer, cmd, marker, arguments))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    continue
+                await self._sleep(cmd)
+                writer.write(self._reply(channel, cmd, arguments).encode() + b'\r\n')
+                if cmd == Command.QUIT:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _readline(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[str]:
+        try:
+            line = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            writer.write(b'ERR buffer_overflow\r\n')
+            return None
+        if len(line) > self.buffer:
+            writer.write(b'ERR buffer_overflow\r\n')
+            return ''
+        return line.decode().strip()
+
+    async def _start(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[Channel]:
+        while True:
+            line = await self._readline(reader, writer)
+            if line is None:
+                return None
+            parts = line.split(' ')
+            if len(parts) != 3 or parts[0] != 'START':
+                writer.write(b'ERR invalid_format(START <mode> <password>)\r\n')
+                continue
+            try:
+                channel = Channel(parts[1])
+            except ValueError:
+                channel = Channel.UNINITIALIZED
+            if channel == Channel.UNINITIALIZED:
+                writer.write(b'ENDED invalid_mode\r\n')
+                return None
+            if parts[2] != self.password:
+                writer.write(b'ENDED authentication_failed\r\n')
+                return None
+            writer.write(f'STARTED {channel.value} protocol(1) buffer({self.buffer})\r\n'.encode())
+            return channel
+
+    async def _event(self, writer: asyncio.StreamWriter, command: Command, marker: str, arguments: str) -> None:
+        await self._sleep(command)
+        text, options, args = self._parse(arguments)
+        limit = int(options.get('LIMIT', 10))
+        offset = int(options.get('OFFSET', 0))
+        if command == Command.QUERY:
+            found = self.index.query(args[0], args[1], text or '')
+        elif command == Command.SUGGEST:
+            found = self.index.suggest(args[0], args[1], text or '')
+        else:
+            found = self.index.list(args[0], args[1])
+        found = found[offset:offset + limit]
+        if not writer.is_closing():
+            writer.write(' '.join(['EVENT', command.value, marker] + found).encode() + b'\r\n')
+
+    def _reply(self, channel: Channel, command: Command, arguments: str) -> str:
+        text, _, args = self._parse(arguments)
+        try:
+            if command == Command.PING:
+                return 'PONG'
+            if command == Command.QUIT:
+                return 'ENDED quit'
+            if command == Command.HELP:
+                if args[:1] != ['commands']:
+                    return 'ERR not_found'
+                return f'RESULT commands({", ".join(cmd.value for cmd in CHANNEL_COMMANDS[channel])})'
+            if command == Command.TRIGGER:
+                return 'OK'
+            if command == Command.INFO:
+                return (
+                    f'RESULT uptime(1) clients_connected({len(self._clients)}) '
+                    f'commands_total({sum(self.commands.values())}) command_latency_best(1) '
+                    'command_latency_worst(1) kv_open_count(1) fst_open_count(1) fst_consolidate_count(0)'
+                )
+            if command == Command.PUSH:
+                if not text:
+                    return 'ERR invalid_format(PUSH <collection> <bucket> <object> "<text>")'
+                self.index.push(args[0], args[1], args[2], text)
+                return 'OK'
+            if command == Command.POP:
+                return f'RESULT {self.index.pop(args[0], args[1], args[2], text or "")}'
+            if command == Command.COUNT:
+                return f'RESULT {self.index.count(*args[:3])}'
+            if command == Command.FLUSHC:
+                return f'RESULT {self.index.flushc(args[0])}'
+            if command == Command.FLUSHB:
+                return f'RESULT {self.index.flushb(args[0], args[1])}'
+            if command == Command.FLUSHO:
+                return f'RESULT {self.index.flusho(args[0], args[1], args[2])}'
+        except IndexError:
+            return 'ERR invalid_format'
+        return 'ERR unknown_command'
+
+    @staticmethod
+    def _parse(arguments: str) -> Tuple[Optional[str], Dict[str, str], List[str]]:
+        text = None
+        match = _TEXT.search(arguments)
+        if match:
+            text = match.group(1).replace('\\"', '"')
+            arguments = arguments[:match.start()] + arguments[match.end():]
+        options = dict(_OPTION.findall(arguments))
+        return text, options, _OPTION.sub('', arguments).split()
+
+    async def _sleep(self, command: Command) -> None:
+        latency = self.latency(command) if callable(self.latency) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+    def _marker(self) -> str:
+        value = next(self._markers)
+        marker = ''
+        for _ in range(8):
+            value, index = divmod(value, len(_MARKER_ALPHABET))
+            marker += _MARKER_ALPHABET[index]
+        return marker
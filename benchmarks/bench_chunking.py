@@ -0,0 +1,42 @@
+"""
+Compare `asonic.client.chunk_text` with the per-character generator it replaced.
+Usage: python benchmarks/bench_chunking.py [size in MB]
+"""
+from collections import deque
+import sys
+from timeit import timeit
+from uuid import uuid4
+
+from asonic.client import BUFFER, chunk_text
+
+
+def legacy_chunk_generator(text: str, buffer: int):
+    empty_string_size = sys.getsizeof(str())
+    chars = deque(text.strip())
+    chunk_size = empty_string_size
+    chunk = str()
+    while chars:
+        char = chars.popleft()
+        chunk += char
+        chunk_size += (sys.getsizeof(char) - empty_string_size)
+        if (not chars) or (chunk_size > (buffer-100)):
+            yield chunk
+            chunk_size = empty_string_size
+            chunk = str()
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    words = int(megabytes * 1024 * 1024 / 37)
+    texts = {
+        'ascii': " ".join(str(uuid4()) for _ in range(words)),
+        'utf-8': " ".join('żółć-' + str(uuid4())[:31] for _ in range(words)),
+    }
+    for name, text in texts.items():
+        legacy = timeit(lambda: list(legacy_chunk_generator(text, BUFFER)), number=1)
+        current = timeit(lambda: list(chunk_text(text, BUFFER)), number=1)
+        print(f'{name} {megabytes}MB: legacy {legacy:.4f}s, chunk_text {current:.4f}s, x{legacy / current:.1f}')
+
+
+if __name__ == '__main__':
+    main()
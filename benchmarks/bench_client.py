@@ -0,0 +1,169 @@
+"""
+Client hot path benchmarks, run against an in-process `asonic.testing.FakeSonic` unless --host is given.
+Prints one JSON object per benchmark (or writes them as a JSON list with --output).
+With --baseline, exits with status 1 if the throughput of a benchmark dropped by more than --tolerance.
+Usage: python benchmarks/bench_client.py [--host HOST --port PORT] [--latency SECONDS] [--scale N] [--output FILE]
+                                         [--baseline FILE [--tolerance RATIO]] [--uvloop]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from uuid import uuid4
+
+from typing import Awaitable, Callable, Dict, List
+
+from asonic import Client
+from asonic.client import TRANSPORTS
+from asonic.enums import Channel
+from asonic.protocol import use_uvloop
+from asonic.testing import FakeSonic
+
+collection = 'benchmark'
+MEASURES = {'seconds', 'ops_per_second', 'p50_ms', 'p99_ms'}
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(name: str, operations: int, concurrency: int, call: Callable[[int], Awaitable], **params) -> Dict:
+    """
+    Run `operations` calls, `concurrency` at a time, and report throughput and latency percentiles
+    """
+    latencies = []  # type: List[float]
+    counter = iter(range(operations))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return dict(
+        name=name,
+        operations=operations,
+        concurrency=concurrency,
+        seconds=round(elapsed, 6),
+        ops_per_second=round(operations / elapsed, 1),
+        p50_ms=round(percentile(latencies, 0.5) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        **params
+    )
+
+
+def regressions(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    def key(result: Dict) -> str:
+        return json.dumps({k: v for k, v in result.items() if k not in MEASURES}, sort_keys=True)
+
+    previous = {key(result): result for result in baseline}
+    found = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is not None and result['ops_per_second'] < before['ops_per_second'] * (1 - tolerance):
+            found.append(f"{key(result)}: {before['ops_per_second']} -> {result['ops_per_second']} ops/s")
+    return found
+
+
+async def run(host: str, port: int, scale: int) -> List[Dict]:
+    results = []
+    bucket = str(uuid4())
+    ingest = await Client.create(host=host, port=port, channel=Channel.INGEST, max_connections=16)
+    control = await Client.create(host=host, port=port, channel=Channel.CONTROL, max_connections=1)
+    await ingest.push(collection, bucket, 'obj', 'The quick brown fox jumps over the lazy dog')
+
+    for transport in TRANSPORTS:
+        search = await Client.create(
+            host=host, port=port, channel=Channel.SEARCH, max_connections=1, transport=transport
+        )
+        results.append(await measure(
+            'query_latency', 100 * scale, 1, lambda _: search.query(collection, bucket, 'quick'), transport=transport
+        ))
+        await search.pool.destroy()
+
+    for transport in TRANSPORTS:
+        for max_connections in (1, 4, 16, 64):
+            for multiplex in (False, True):
+                search = await Client.create(
+                    host=host, port=port, channel=Channel.SEARCH, max_connections=max_connections, multiplex=multiplex,
+                    transport=transport
+                )
+                results.append(await measure(
+                    'query_throughput', 500 * scale, 64, lambda _: search.query(collection, bucket, 'quick'),
+                    max_connections=max_connections, multiplex=multiplex, transport=transport
+                ))
+                await search.pool.destroy()
+
+    small = 'The quick brown fox jumps over the lazy dog'
+    results.append(await measure(
+        'push_small', 500 * scale, 16, lambda i: ingest.push(collection, bucket, f'small-{i}', small)
+    ))
+    large = ' '.join(str(uuid4()) for _ in range(2 * 1024 * 1024 // 37))
+    results.append(await measure(
+        'push_2mb', scale, 1, lambda i: ingest.push(collection, bucket, f'large-{i}', large),
+        text_bytes=len(large.encode())
+    ))
+
+    results.append(await measure('info', 200 * scale, 1, lambda _: control.info()))
+
+    search = await Client.create(host=host, port=port, channel=Channel.SEARCH, max_connections=4)
+    results.append(await measure(
+        'pool_contention', 1000 * scale, 256, lambda _: search.ping(), max_connections=4
+    ))
+
+    await search.pool.destroy()
+    await ingest.flushb(collection, bucket)
+    for client in (ingest, control):
+        await client.pool.destroy()
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', help='Sonic host, an in-process fake server is used if not set')
+    parser.add_argument('--port', type=int, default=1491)
+    parser.add_argument('--latency', type=float, default=0.0, help='fake server latency per command, in seconds')
+    parser.add_argument('--scale', type=int, default=1, help='multiplies the number of operations')
+    parser.add_argument('--output', help='write results as a JSON list to this file')
+    parser.add_argument('--baseline', help='JSON list written by a previous run with --output')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed throughput drop from the baseline')
+    parser.add_argument('--uvloop', action='store_true', help='run on uvloop (must be installed)')
+    args = parser.parse_args()
+    # the policy has to be set before the event loop is created
+    if args.uvloop and not use_uvloop():
+        parser.error('uvloop is not installed')
+    return args
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.host:
+        results = await run(args.host, args.port, args.scale)
+    else:
+        async with FakeSonic(port=0, latency=args.latency) as server:
+            results = await run(server.host, server.port, args.scale)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        for result in results:
+            json.dump(result, sys.stdout)
+            sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            sys.stderr.write(f'regression {regression}\n')
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    asyncio.get_event_loop().run_until_complete(main(arguments))
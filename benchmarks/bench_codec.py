@@ -0,0 +1,83 @@
+"""
+Compare `asonic.codec` with the ad hoc encoding and parsing it replaced: time and peak allocated bytes per call.
+Usage: python benchmarks/bench_codec.py [number of calls]
+"""
+import sys
+import tracemalloc
+from timeit import timeit
+
+from asonic.codec import encode, parse_event, parse_info, parse_result
+from asonic.enums import Command
+
+QUERY = b'EVENT QUERY Bt2m2gYa ' + b' '.join(b'conversation:%08x' % i for i in range(20))
+RESULT = b'RESULT 42'
+INFO = (b'INFO uptime(6730) clients_connected(1) commands_total(2384) command_latency_best(1) '
+        b'command_latency_worst(19) kv_open_count(1) fst_open_count(1) fst_consolidate_count(0)')
+
+
+def legacy_encode(command, *args, **kwargs):
+    values = []
+    for k in kwargs:
+        if kwargs[k] is not None:
+            if k == 'limit':
+                values.append(f'LIMIT({kwargs[k]})')
+            elif k == 'offset':
+                values.append(f'OFFSET({kwargs[k]})')
+            elif k == 'locale':
+                values.append(f'LANG({kwargs[k]})')
+            else:
+                values.append(kwargs[k])
+    return f'{command.value} {" ".join(args)} {" ".join(values)}'.strip()
+
+
+def legacy_event(response):
+    tokens = response.split()
+    if len(tokens) == 3:
+        return []
+    return tokens[3:]
+
+
+def legacy_info(res):
+    return dict(map(lambda x: x.replace('(', ' ').replace(')', '').split(), res[7:].decode().split()))
+
+
+CASES = {
+    'encode': (
+        lambda: legacy_encode(Command.QUERY, 'messages', 'user', '"quick fox"', limit=10, offset=None, locale='eng'),
+        lambda: encode(
+            Command.QUERY, ('messages', 'user', '"quick fox"'), {'limit': 10, 'offset': None, 'locale': 'eng'}
+        ),
+    ),
+    'result': (lambda: int(RESULT[7:]), lambda: parse_result(RESULT)),
+    'query_bytes': (lambda: legacy_event(QUERY), lambda: parse_event(QUERY)),
+    'query_str': (lambda: [t.decode() for t in legacy_event(QUERY)], lambda: parse_event(QUERY, 'str')),
+    'info': (lambda: legacy_info(INFO), lambda: parse_info(INFO)),
+}
+
+
+def allocations(call, number: int = 1000) -> float:
+    """
+    Peak bytes allocated by a call, averaged over `number` calls
+    """
+    tracemalloc.start()
+    total = 0
+    for _ in range(number):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        call()
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / number
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for name, (legacy, current) in CASES.items():
+        legacy_time = timeit(legacy, number=number) / number * 1e9
+        current_time = timeit(current, number=number) / number * 1e9
+        print(f'{name}: legacy {legacy_time:.0f}ns {allocations(legacy):.0f}B, '
+              f'codec {current_time:.0f}ns {allocations(current):.0f}B')
+
+
+if __name__ == '__main__':
+    main()
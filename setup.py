@@ -24,5 +24,9 @@ setup(
     install_requires=[],
     extras_require={
         'tests': ['pytest', 'pytest-asyncio', 'flake8'],
+        'uvloop': ['uvloop'],
+    },
+    entry_points={
+        'console_scripts': ['asonic-ingest=asonic.ingest:main'],
     },
 )
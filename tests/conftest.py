@@ -1,13 +1,36 @@
+import asyncio
 from os import getenv
+from threading import Thread
 
+import pytest
 import pytest_asyncio
 
 from asonic import Client
 from asonic.enums import Channel
+from asonic.testing import FakeSonic
 
 collection = 'collection'
 
 
+@pytest.fixture(scope='session', autouse=True)
+def fake_sonic():
+    """
+    Run the tests against an in-process fake server instead of Sonic when SONIC_FAKE is set
+    """
+    if not getenv('SONIC_FAKE'):
+        yield None
+        return
+    loop = asyncio.new_event_loop()
+    server = FakeSonic(host=getenv('SONIC_HOST', 'localhost'), port=1491)
+    loop.run_until_complete(server.start())
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
 @pytest_asyncio.fixture
 async def clean():
     c = Client(host=getenv('SONIC_HOST', 'localhost'), port=1491)
@@ -34,3 +57,17 @@ async def control():
     c = Client(host=getenv('SONIC_HOST', 'localhost'), port=1491)
     await c.channel(Channel.CONTROL)
     return c
+
+
+@pytest_asyncio.fixture
+async def multiplexed_search() -> Client:
+    c = Client(host=getenv('SONIC_HOST', 'localhost'), port=1491, max_connections=2, multiplex=True)
+    await c.channel(Channel.SEARCH)
+    return c
+
+
+@pytest_asyncio.fixture
+async def pipelined_ingest():
+    c = Client(host=getenv('SONIC_HOST', 'localhost'), port=1491, max_connections=1, multiplex=True, max_in_flight=256)
+    await c.channel(Channel.INGEST)
+    return c
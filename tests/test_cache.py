@@ -0,0 +1,49 @@
+from asonic.cache import ResultCache
+from asonic.enums import Command
+
+
+def key(bucket, text='quick'):
+    return Command.QUERY, 'collection', bucket, text, ()
+
+
+def test_ttl():
+    now = [0.0]
+    cache = ResultCache(ttl=10, clock=lambda: now[0])
+    cache.set(key('b'), 'collection', 'b', [b'uid'], cache.generation())
+    assert cache.get(key('b')) == [b'uid']
+    now[0] = 10
+    assert cache.get(key('b')) is None
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'evictions': 0, 'invalidations': 0}
+
+
+def test_lru():
+    cache = ResultCache(max_size=2)
+    for text in ('a', 'b'):
+        cache.set(key('b', text), 'collection', 'b', [], cache.generation())
+    assert cache.get(key('b', 'a')) == []
+    cache.set(key('b', 'c'), 'collection', 'b', [], cache.generation())
+    assert cache.get(key('b', 'b')) is None
+    assert cache.get(key('b', 'a')) == []
+    assert cache.evictions == 1
+
+
+def test_invalidate():
+    cache = ResultCache()
+    for bucket in ('b1', 'b2'):
+        cache.set(key(bucket), 'collection', bucket, [b'uid'], cache.generation())
+    cache.invalidate('collection', 'b1')
+    assert cache.get(key('b1')) is None
+    assert cache.get(key('b2')) == [b'uid']
+    cache.invalidate('collection')
+    assert len(cache) == 0
+
+    generation = cache.generation()
+    cache.invalidate('collection', 'b1')
+    # fetched before the invalidation, must not be stored
+    cache.set(key('b1'), 'collection', 'b1', [b'stale'], generation)
+    cache.set(key('b2'), 'collection', 'b2', [b'uid'], generation)
+    assert cache.get(key('b1')) is None
+    assert cache.get(key('b2')) == [b'uid']
+    cache.invalidate()
+    cache.set(key('b2'), 'collection', 'b2', [b'uid'], generation)
+    assert len(cache) == 0
@@ -0,0 +1,37 @@
+import pytest
+
+from asonic.codec import encode, event_marker, parse_event, parse_info, parse_result, parse_started
+from asonic.enums import Command
+from asonic.exceptions import ServerError
+
+
+def test_encode():
+    assert encode(Command.PING, ()) == 'PING'
+    assert encode(Command.QUERY, ('c', 'b', '"quick fox"'), {'limit': 10, 'offset': None, 'locale': 'eng'}) == \
+        'QUERY c b "quick fox" LIMIT(10) LANG(eng)'
+    assert encode(Command.COUNT, ('c',), {'bucket': 'b', 'object': None}) == 'COUNT c b'
+    assert encode(Command.TRIGGER, (), {'action': 'consolidate'}) == 'TRIGGER consolidate'
+
+
+def test_parse_event():
+    line = b'EVENT QUERY Bt2m2gYa conversation:71f3d63b conversation:6501e83a'
+    assert event_marker(line) == b'Bt2m2gYa'
+    assert parse_event(line) == [b'conversation:71f3d63b', b'conversation:6501e83a']
+    assert parse_event(line, 'str') == ['conversation:71f3d63b', 'conversation:6501e83a']
+    for result_type in ('bytes', 'str'):
+        assert parse_event(b'EVENT SUGGEST z98uDE0f', result_type) == []
+    with pytest.raises(ServerError):
+        parse_event(b'PENDING z98uDE0f')
+    with pytest.raises(ServerError):
+        parse_event(b'', 'str')
+
+
+def test_parse_replies():
+    assert parse_started(b'STARTED search protocol(1) buffer(20000)') == 20000
+    assert parse_started(b'STARTED search protocol(1)') is None
+    assert parse_result(b'RESULT 42') == 42
+    with pytest.raises(ServerError):
+        parse_result(b'OK')
+    assert parse_info(b'INFO uptime(12) clients_connected(1) command_latency_best(1)') == {
+        'uptime': '12', 'clients_connected': '1', 'command_latency_best': '1'
+    }
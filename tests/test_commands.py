@@ -1,13 +1,16 @@
 from contextlib import nullcontext as does_not_raise
-import math
+import asyncio
+from os import getenv
 import pytest
-import sys
 from uuid import uuid4
 
 from asonic import Client
-from asonic.client import BUFFER
-from asonic.enums import Action, Channel
-from asonic.exceptions import ClientError, ConnectionClosed
+from asonic.cache import ResultCache
+from asonic.client import BUFFER, _paginate, chunk_text, escape
+from asonic.enums import Action, Channel, Command
+from asonic.exceptions import ClientError, ConnectionClosed, ServerError, Timeout
+from asonic.metrics import Metrics
+from asonic.testing import FakeSonic
 
 collection = 'collection'
 
@@ -115,14 +118,27 @@ async def test_ingest(search, ingest):
     assert (await ingest.push(collection, bucket, uid, 'żółć')) == b'OK'
     assert (await search.query(collection, bucket, 'żółć', limit=1)) == [uid.encode()]
     long_string = " ".join(str(uuid4()) for _ in range(10000))
-    total_size = sys.getsizeof(long_string)
-    expected_chunks = math.ceil(total_size/BUFFER)
-    chunks = list(ingest._chunk_generator(long_string, BUFFER))
-    assert expected_chunks == len(chunks)
+    chunks = list(chunk_text(long_string, BUFFER))
+    assert " ".join(chunks) == long_string
     for chunk in chunks:
-        assert sys.getsizeof(chunk) <= BUFFER
+        assert len(escape(chunk).encode()) - 2 <= BUFFER
+        assert len(chunk.split()[0]) == 36
+    assert ingest.pool.buffer == BUFFER
     assert (await ingest.push(collection, bucket, uid, long_string)) == b'OK'
 
+
+async def test_chunk_text():
+    assert list(chunk_text('  ', 10)) == []
+    assert list(chunk_text('quick brown fox', 11)) == ['quick brown', 'fox']
+    assert list(chunk_text('żółć żółć', 8)) == ['żółć', 'żółć']
+    assert list(chunk_text('żółć', 5)) == ['żó', 'łć']
+    assert list(chunk_text('say "hi" now', 10)) == ['say "hi"', 'now']
+    assert list(chunk_text('say "hi" now', 9)) == ['say', '"hi"', 'now']
+    assert list(chunk_text('abcdefgh', 4)) == ['abcd', 'efgh']
+    # quote-dense text, every quote takes two bytes
+    assert list(chunk_text('a """""""" b', 4)) == ['a', '""', '""', '""', '""', 'b']
+    assert list(chunk_text('x"""""', 5)) == ['x""', '""', '"']
+
 async def test_limit_offset(search, ingest):
     bucket = str(uuid4())
     uid = str(uuid4())
@@ -135,6 +151,24 @@ async def test_limit_offset(search, ingest):
     assert (await search.query(collection, bucket, 'fox', limit=1, offset=1)) == [uid.encode()]
 
 
+async def test_multiplex(multiplexed_search, ingest, control):
+    bucket = str(uuid4())
+    uid = str(uuid4())
+    assert (await ingest.push(collection, bucket, uid, 'The quick brown fox jumps over the lazy dog')) == b'OK'
+    assert (await control.trigger(Action.CONSOLIDATE)) == b'OK'
+    results = await asyncio.gather(*(
+        coro
+        for _ in range(50)
+        for coro in (
+            multiplexed_search.query(collection, bucket, 'quick'),
+            multiplexed_search.suggest(collection, bucket, 'bro'),
+            multiplexed_search.ping(),
+        )
+    ))
+    assert results == [[uid.encode()], [b'brown'], b'PONG'] * 50
+    assert multiplexed_search.pool._created_connections <= 2
+
+
 async def test_mixed_commands(search):
     try:
         await search.push()
@@ -161,3 +195,219 @@ async def test_command_before_channel():
         pass
     else:
         raise AssertionError('Should raise exception when not calling channel')
+
+
+async def test_push_many(search, ingest):
+    bucket = str(uuid4())
+    uids = [str(uuid4()) for _ in range(20)]
+
+    async def records():
+        for uid in uids:
+            yield collection, bucket, uid, 'The quick brown fox'
+        yield collection, bucket, 'missing text'
+
+    results = {record[2]: result async for record, result in ingest.push_many(records(), concurrency=4)}
+    assert [results[uid] for uid in uids] == [b'OK'] * 20
+    assert isinstance(results['missing text'], TypeError)
+    assert len(await search.query(collection, bucket, 'fox', limit=100)) == 20
+
+    results = [result async for _, result in ingest.pop_many([(collection, bucket, uid, 'fox') for uid in uids])]
+    assert results == [1] * 20
+    results = [result async for _, result in ingest.flusho_many([(collection, bucket, uid) for uid in uids])]
+    assert results == [2] * 20
+
+
+async def test_pipelined_ingest(search, pipelined_ingest):
+    bucket = str(uuid4())
+    uids = [str(uuid4()) for _ in range(100)]
+    results = await asyncio.gather(*(
+        pipelined_ingest.push(collection, bucket, uid, 'The quick brown fox jumps over the lazy dog') for uid in uids
+    ))
+    assert results == [b'OK'] * 100
+    results = await asyncio.gather(*(pipelined_ingest.pop(collection, bucket, uid, 'quick') for uid in uids))
+    assert results == [1] * 100
+    assert (await pipelined_ingest.count(collection, bucket, uids[0])) == 5
+    long_string = " ".join(str(uuid4()) for _ in range(10000))
+    assert (await pipelined_ingest.push(collection, bucket, uids[0], long_string)) == b'OK'
+    assert len(await search.query(collection, bucket, 'fox', limit=100)) == 100
+    assert pipelined_ingest.pool._created_connections == 1
+
+
+async def test_cache():
+    cache = ResultCache()
+    host = getenv('SONIC_HOST', 'localhost')
+    search = await Client.create(host=host, channel=Channel.SEARCH, cache=cache)
+    ingest = await Client.create(host=host, channel=Channel.INGEST, cache=cache)
+    control = await Client.create(host=host, channel=Channel.CONTROL, cache=cache)
+    bucket = str(uuid4())
+    uid = str(uuid4())
+    assert (await search.query(collection, bucket, 'quick')) == []
+    assert (await search.query(collection, bucket, 'quick')) == []
+    assert cache.hits == 1
+    assert (await ingest.push(collection, bucket, uid, 'The quick brown fox jumps over the lazy dog')) == b'OK'
+    assert (await search.query(collection, bucket, 'quick')) == [uid.encode()]
+    assert (await search.suggest(collection, bucket, 'bro')) == [b'brown']
+    assert (await control.trigger(Action.CONSOLIDATE)) == b'OK'
+    assert len(cache) == 0
+    assert (await search.query(collection, bucket, 'quick')) == [uid.encode()]
+    assert (await ingest.flushb(collection, bucket)) == 1
+    assert (await search.query(collection, bucket, 'quick')) == []
+    assert cache.stats()['hits'] == 1
+
+
+async def test_pool_min_connections():
+    c = await Client.create(host=getenv('SONIC_HOST', 'localhost'), min_connections=3, idle_timeout=0.2)
+    assert c.pool._created_connections == 3
+    assert (await asyncio.gather(*(c.ping() for _ in range(6)))) == [b'PONG'] * 6
+    assert c.pool._created_connections == 6
+    await asyncio.sleep(0.5)
+    assert c.pool._created_connections == 3
+    assert (await c.ping()) == b'PONG'
+
+
+async def test_pool_broken_connection():
+    c = await Client.create(host=getenv('SONIC_HOST', 'localhost'), max_connections=1)
+    connection = await c.pool.get_connection()
+    connection.writer.close()
+    await c.pool.release(connection)
+    assert (await c.ping()) == b'PONG'
+    assert c.pool._created_connections == 1
+
+    # a cancelled command must not leak its connection
+    task = asyncio.ensure_future(c.query(collection, 'user1', 'test'))
+    await asyncio.sleep(0)
+    task.cancel()
+    assert (await asyncio.wait_for(c.ping(), 1)) == b'PONG'
+    assert c.pool._created_connections == 1
+
+
+async def test_metrics():
+    metrics = Metrics()
+    c = await Client.create(host=getenv('SONIC_HOST', 'localhost'), channel=Channel.INGEST, metrics=metrics)
+    assert (await c.push(collection, str(uuid4()), str(uuid4()), 'The quick brown fox')) == b'OK'
+    try:
+        await c.help('unknown')
+    except ServerError:
+        pass
+    stats = metrics.to_dict()
+    assert stats['commands']['ingest']['PUSH']['count'] == 1
+    assert stats['errors'] == {'ingest': {'HELP': {'ServerError': 1}}}
+    assert stats['pool_wait']['ingest']['count'] == 3
+    assert stats['connections'] == {'ingest': {'in_use': 0, 'idle': 1}}
+    assert stats['bytes_written'] > 100
+    assert stats['bytes_read'] > 20
+    assert 'asonic_pool_connections{channel="ingest",state="idle"} 1' in metrics.to_prometheus()
+
+
+async def test_result_type(ingest, control):
+    bucket = str(uuid4())
+    await ingest.push(collection, bucket, 'obj', 'The quick brown fox')
+    await control.trigger(Action.CONSOLIDATE)
+    search = await Client.create(host=getenv('SONIC_HOST', 'localhost'), port=1491, result_type='str')
+    assert await search.query(collection, bucket, 'quick') == ['obj']
+    assert await search.list(collection, bucket) == ['brown', 'fox', 'quick']
+    assert await search.suggest(collection, bucket, 'qui') == ['quick']
+    for result_type in ('int', 'memoryview'):
+        with pytest.raises(ClientError):
+            Client(result_type=result_type)
+
+
+async def test_iter_pages(search, ingest, control):
+    bucket = str(uuid4())
+    objects = [f'obj{i:02}' for i in range(25)]
+    for obj in objects:
+        await ingest.push(collection, bucket, obj, f'fox word{obj}')
+    await control.trigger(Action.CONSOLIDATE)
+    results = [item async for item in search.iter_query(collection, bucket, 'fox', page_size=10, prefetch=2)]
+    assert results == [obj.encode() for obj in reversed(objects)]
+    words = [item async for item in search.iter_list(collection, bucket, page_size=13)]
+    assert words == [b'fox'] + [f'wordobj{i:02}'.encode() for i in range(25)]
+    assert [item async for item in search.iter_query(collection, bucket, 'nothing')] == []
+
+    pages = search.iter_list(collection, bucket, page_size=2)
+    assert (await pages.__anext__()) == b'fox'
+    await pages.aclose()
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+async def test_paginate_prefetch(prefetch):
+    requested = []
+
+    async def page(limit, offset):
+        await asyncio.sleep(0.01)
+        return list(range(offset, min(offset + limit, 25)))
+
+    def fetch(limit, offset):
+        requested.append(offset)
+        return page(limit, offset)
+
+    items = []
+    ahead = []
+    async for item in _paginate(fetch, 10, prefetch):
+        items.append(item)
+        # pages requested after the one being consumed
+        ahead.append(len(requested) - (item // 10 + 1))
+        await asyncio.sleep(0.02)
+    assert items == list(range(25))
+    assert max(ahead) == prefetch
+    # without prefetch, nothing is requested past the short page
+    assert requested == ([0, 10, 20] if prefetch == 0 else [0, 10, 20, 30, 40])
+
+
+async def test_query_buckets():
+    async with FakeSonic(port=0) as server:
+        ingest = await Client.create(host=server.host, port=server.port, channel=Channel.INGEST)
+        search = await Client.create(host=server.host, port=server.port)
+        buckets = ['b1', 'b2', 'b3']
+        for bucket in buckets:
+            await ingest.push(collection, bucket, 'shared', 'The quick brown fox')
+            await ingest.push(collection, bucket, f'{bucket}-obj', 'The quick brown fox')
+        assert (await search.query_buckets(collection, buckets, 'fox')) == [b'b1-obj', b'b2-obj', b'b3-obj', b'shared']
+        assert (await search.query_buckets(collection, buckets, 'fox', limit=2)) == [b'b1-obj', b'b2-obj']
+
+        # the first two results are settled once the first two buckets answered, the last one is not queried
+        queries = server.commands['QUERY']
+        assert (await search.query_buckets(collection, buckets, 'fox', limit=2, concurrency=1)) == \
+            [b'b1-obj', b'b2-obj']
+        assert server.commands['QUERY'] == queries + 2
+        await search.pool.destroy()
+        await ingest.pool.destroy()
+
+
+async def test_coalesce():
+    async with FakeSonic(port=0, latency=lambda command: 0.05 if command == Command.QUERY else 0) as server:
+        ingest = await Client.create(host=server.host, port=server.port, channel=Channel.INGEST)
+        search = await Client.create(host=server.host, port=server.port, coalesce=True)
+        await ingest.push(collection, 'b', 'obj', 'The quick brown fox')
+        results = await asyncio.gather(*(search.query(collection, 'b', 'fox') for _ in range(10)))
+        assert results == [[b'obj']] * 10
+        assert server.commands['QUERY'] == 1
+        assert search.coalesced == 9
+        assert (await asyncio.gather(search.query(collection, 'b', 'fox'), search.query(collection, 'b', 'quick'))) \
+            == [[b'obj'], [b'obj']]
+        assert server.commands['QUERY'] == 3
+
+        # a cancelled caller doesn't abort the request of the others
+        tasks = [asyncio.ensure_future(search.query(collection, 'b', 'fox')) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        tasks[0].cancel()
+        assert (await asyncio.gather(*tasks[1:])) == [[b'obj']] * 2
+        assert tasks[0].cancelled()
+        assert server.commands['QUERY'] == 4
+
+        # the request is cancelled with its last caller
+        tasks = [asyncio.ensure_future(search.query(collection, 'b', 'fox')) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert search._flights == {}
+
+        # errors are shared too
+        results = await asyncio.gather(
+            *(search.query(collection, 'b', 'fox', timeout=0.01) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(result, Timeout) for result in results)
+        assert server.commands['QUERY'] == 6
+        await search.pool.destroy()
+        await ingest.pool.destroy()
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from asonic import Client
+from asonic.consolidate import Consolidator
+from asonic.enums import Channel
+from asonic.exceptions import ServerError
+from asonic.testing import FakeSonic
+
+pytestmark = pytest.mark.asyncio
+collection = 'collection'
+
+
+async def clients(server, **kwargs):
+    control = await Client.create(host=server.host, port=server.port, channel=Channel.CONTROL)
+    consolidator = Consolidator(control, **kwargs)
+    ingest = await Client.create(host=server.host, port=server.port, channel=Channel.INGEST, consolidator=consolidator)
+    return consolidator, ingest
+
+
+async def test_quiet():
+    async with FakeSonic(port=0) as server:
+        consolidator, ingest = await clients(server, quiet=0.05, min_interval=0)
+        for i in range(3):
+            await ingest.push(collection, 'b', f'obj{i}', 'The quick brown fox')
+        await ingest.pop(collection, 'b', 'obj0', 'fox')
+        await ingest.count(collection, 'b')
+        assert consolidator.pending == 4
+        await asyncio.sleep(0.2)
+        assert server.commands['TRIGGER'] == 1
+        assert consolidator.stats()['runs'] == 1
+        assert consolidator.pending == 0
+        assert consolidator.last_run is not None
+        await consolidator.close()
+        assert server.commands['TRIGGER'] == 1
+
+
+async def test_max_writes_and_rate():
+    async with FakeSonic(port=0) as server:
+        consolidator, ingest = await clients(server, max_writes=2, quiet=10, min_interval=0.3)
+        for i in range(4):
+            await ingest.push(collection, 'b', f'obj{i}', 'fox')
+        await asyncio.sleep(0.1)
+        # the second batch waits for min_interval
+        assert server.commands['TRIGGER'] == 1
+        assert consolidator.pending == 2
+        await asyncio.sleep(0.4)
+        assert server.commands['TRIGGER'] == 2
+        await consolidator.close()
+
+
+async def test_max_delay():
+    async with FakeSonic(port=0) as server:
+        consolidator, ingest = await clients(server, quiet=0.1, max_delay=0.15, min_interval=0)
+        for i in range(8):
+            await ingest.push(collection, 'b', f'obj{i}', 'fox')
+            await asyncio.sleep(0.04)
+        # writes never went quiet
+        assert server.commands['TRIGGER'] >= 1
+        await consolidator.close(flush=False)
+
+
+async def test_client_close():
+    async with FakeSonic(port=0) as server:
+        consolidator, ingest = await clients(server, quiet=10)
+        await ingest.push(collection, 'b', 'obj', 'fox')
+        task = consolidator._task
+        assert task is not None and not task.done()
+        await ingest.close()
+        assert task.cancelled()
+        # the pending write was consolidated on close
+        assert server.commands['TRIGGER'] == 1
+        await consolidator.control.close()
+
+
+async def test_failure():
+    class Control:
+        async def trigger(self, action):
+            raise ServerError('busy')
+
+    consolidator = Consolidator(Control(), quiet=0, min_interval=0, retry_delay=0.05)
+    consolidator.written(3)
+    await asyncio.sleep(0.01)
+    assert consolidator.failures == 1
+    assert consolidator.pending == 3
+    assert not (await consolidator.consolidate())
+    await consolidator.close(flush=False)
+    assert consolidator.last_run is None
@@ -0,0 +1,70 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel
+from asonic.ingest import _batches, load, parse_args, read_records
+from asonic.testing import FakeSonic
+
+collection = 'collection'
+
+
+def test_read_records():
+    data = b'id,text\n1,"The quick\nbrown fox"\n2,"lazy ""dog"""\n3,cat'
+    assert list(read_records(io.BytesIO(data), quoted=True)) == [
+        b'id,text\n', b'1,"The quick\nbrown fox"\n', b'2,"lazy ""dog"""\n', b'3,cat'
+    ]
+    assert len(list(read_records(io.BytesIO(data)))) == 5
+
+
+def test_batches_resume():
+    data = b'id,text\n1,a\n2,b\n3,c\n'
+    batches = list(_batches(io.BytesIO(data), 'csv', 0, 2))
+    assert batches == [(['id', 'text'], [b'1,a\n', b'2,b\n'], 16), (['id', 'text'], [b'3,c\n'], 20)]
+    # the header is read before jumping to the offset, from a stream that can't seek too
+    assert list(_batches(io.BytesIO(data), 'csv', 16, 2)) == [(['id', 'text'], [b'3,c\n'], 20)]
+    stream = io.BufferedReader(io.BytesIO(data))
+    stream.seekable = lambda: False
+    assert list(_batches(stream, 'csv', 12, 2)) == [(['id', 'text'], [b'2,b\n', b'3,c\n'], 20)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('workers', [0, 2])
+async def test_load(tmp_path, workers):
+    jsonl = tmp_path / 'objects.jsonl'
+    jsonl.write_text(''.join(
+        json.dumps({'id': i, 'user': f'user{i % 2}', 'title': '<b>The quick</b>', 'body': 'brown fox'}) + '\n'
+        for i in range(10)
+    ) + 'not json\n[1, 2]\n"x"\n' + json.dumps({'id': 10, 'user': 'user0'}) + '\n' +
+        json.dumps({'id': 12, 'user': 'user2', 'title': 0}) + '\n')
+    csv_file = tmp_path / 'objects.csv'
+    csv_file.write_text('id,user,title,body\n11,user0,"lazy, ""dog""",\n')
+    checkpoint = tmp_path / 'checkpoint.json'
+
+    async with FakeSonic(port=0) as server:
+        argv = [
+            str(jsonl), str(csv_file), '--collection', collection, '--bucket-field', 'user', '--text-field', 'title',
+            '--text-field', 'body', '--strip-markup', '--workers', str(workers), '--batch-size', '3',
+            '--checkpoint', str(checkpoint), '--port', str(server.port), '--progress-interval', '60'
+        ]
+        stats = await load(parse_args(argv))
+        assert stats['docs'] == 12
+        assert stats['skipped'] == 4
+        assert stats['errors'] == 0
+        assert json.loads(checkpoint.read_text()) == {
+            str(jsonl): jsonl.stat().st_size, str(csv_file): csv_file.stat().st_size
+        }
+        ingest = await Client.create(port=server.port, channel=Channel.INGEST)
+        assert (await ingest.count(collection, 'user1')) == 3
+        search = await Client.create(port=server.port)
+        assert (await search.query(collection, 'user0', 'dog')) == [b'11']
+        assert (await search.query(collection, 'user2', '0')) == [b'12']
+
+        # nothing left to push
+        stats = await load(parse_args(argv))
+        assert stats['docs'] == 0
+        assert server.commands['PUSH'] == 12
+        await asyncio.gather(ingest.pool.destroy(), search.pool.destroy())
@@ -0,0 +1,146 @@
+import os
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel, Command
+from asonic.journal import Journal, read
+from asonic.testing import FakeSonic
+
+collection = 'collection'
+
+
+def test_segments(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = Journal(path, segment_size=100)
+    for i in range(10):
+        journal.append(Command.PUSH, (collection, 'b', f'obj{i}', '"The quick brown fox"'), 'eng' if i else None)
+    journal.append(Command.FLUSHB, (collection, 'b'))
+    journal.close()
+    assert len(journal.segments()) > 1
+    records = list(read(path))
+    assert records[0] == (Command.PUSH, (collection, 'b', 'obj0', '"The quick brown fox"', None))
+    assert records[9] == (Command.PUSH, (collection, 'b', 'obj9', '"The quick brown fox"', 'eng'))
+    assert records[10] == (Command.FLUSHB, (collection, 'b'))
+
+    # a record torn by a crash is dropped and overwritten
+    last = journal.segments()[-1]
+    with open(last, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00garbage')
+    assert len(list(read(path))) == 11
+    journal = Journal(path, segment_size=100)
+    journal.append(Command.FLUSHC, (collection,))
+    journal.close()
+    assert list(read(path))[-2:] == [(Command.FLUSHB, (collection, 'b')), (Command.FLUSHC, (collection,))]
+
+
+def test_compact(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=200)
+    journal.append(Command.PUSH, (collection, 'b1', 'obj1', '"fox"'))
+    journal.append(Command.PUSH, (collection, 'b1', 'obj2', '"fox"'))
+    journal.append(Command.PUSH, (collection, 'b2', 'obj1', '"fox"'))
+    journal.append(Command.POP, (collection, 'b1', 'obj2', '"fox"'))
+    journal.append(Command.FLUSHO, (collection, 'b1', 'obj1'))
+    journal.append(Command.FLUSHB, ('other', 'b1'))
+    journal.append(Command.PUSH, (collection, 'b1', 'obj1', '"dog"'))
+    journal.append(Command.PUSH, ('other', 'b1', 'obj1', '"dog"'))
+    journal.append(Command.FLUSHC, ('other',))
+    assert journal.compact() == 5
+    assert list(read(str(tmp_path))) == [
+        (Command.PUSH, (collection, 'b1', 'obj2', '"fox"', None)),
+        (Command.PUSH, (collection, 'b2', 'obj1', '"fox"', None)),
+        (Command.POP, (collection, 'b1', 'obj2', '"fox"')),
+        (Command.PUSH, (collection, 'b1', 'obj1', '"dog"', None)),
+    ]
+    assert len(journal.segments()) == 1
+    assert os.listdir(str(tmp_path)) == [os.path.basename(journal.segments()[0])]
+    journal.append(Command.FLUSHC, (collection,))
+    journal.close()
+    assert len(list(read(str(tmp_path)))) == 5
+
+
+def test_interrupted_compact(tmp_path, monkeypatch):
+    path = str(tmp_path)
+
+    def fill():
+        journal = Journal(path, segment_size=100)
+        for i in range(6):
+            journal.append(Command.PUSH, (collection, 'b', f'obj{i}', '"fox"'))
+        journal.append(Command.FLUSHO, (collection, 'b', 'obj0'))
+        return journal
+
+    def crash(*args):
+        raise OSError('crash')
+
+    # while writing the compacted segments, the original ones are kept
+    journal = fill()
+    with monkeypatch.context() as patch:
+        patch.setattr('asonic.journal.encode_record', crash)
+        with pytest.raises(OSError):
+            journal.compact()
+    assert len(list(read(path))) == 7
+    journal = Journal(path, segment_size=100)
+    assert len(list(read(path))) == 7
+    assert sorted(os.listdir(path)) == [os.path.basename(segment) for segment in journal.segments()]
+    journal.close()
+
+    # while swapping the segments (moving the compacted ones in, removing the old ones), the compaction is finished
+    for name, calls in (('replace', 2), ('remove', 1)):
+        for segment in journal.segments():
+            os.remove(segment)
+        journal = fill()
+        with monkeypatch.context() as patch:
+            done = []
+            original = getattr(os, name)
+
+            def interrupted(*args):
+                if len(done) == calls:
+                    crash()
+                original(*args)
+                done.append(args)
+
+            patch.setattr(f'asonic.journal.os.{name}', interrupted)
+            with pytest.raises(OSError):
+                journal.compact()
+        journal = Journal(path, segment_size=100)
+        assert [fields[2] for _, fields in read(path)] == [f'obj{i}' for i in range(1, 6)]
+        assert sorted(os.listdir(path)) == [os.path.basename(segment) for segment in journal.segments()]
+        journal.close()
+
+
+def test_fsync_interval(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr('asonic.journal.os.fsync', synced.append)
+    journal = Journal(str(tmp_path), fsync=True, fsync_interval=60)
+    for i in range(100):
+        journal.append(Command.PUSH, (collection, 'b', f'obj{i}', '"fox"'))
+    assert not synced
+    journal.close()
+    assert len(synced) == 1
+    assert len(list(read(str(tmp_path)))) == 100
+
+
+@pytest.mark.asyncio
+async def test_replay(tmp_path):
+    journal = Journal(str(tmp_path))
+    async with FakeSonic(port=0) as source, FakeSonic(port=0) as target:
+        ingest = await Client.create(host=source.host, port=source.port, channel=Channel.INGEST, journal=journal)
+        for i in range(20):
+            await ingest.push(collection, 'b', f'obj{i}', 'The "quick" brown fox', locale='eng')
+        assert (await ingest.pop(collection, 'b', 'obj0', 'fox')) == 1
+        assert (await ingest.flusho(collection, 'b', 'obj1')) == 3
+        await ingest.push(collection, 'b', 'obj1', 'lazy dog')
+        await ingest.ping()
+        assert journal.records == 23
+
+        rebuilt = await Client.create(host=target.host, port=target.port, channel=Channel.INGEST, multiplex=True)
+        assert (await rebuilt.replay(str(tmp_path), concurrency=8)) == \
+            {'PUSH': 21, 'POP': 1, 'FLUSHC': 0, 'FLUSHB': 0, 'FLUSHO': 1}
+        assert target.commands['PUSH'] == 21
+        for client in (ingest, rebuilt):
+            assert (await client.count(collection, 'b', 'obj0')) == 2
+            assert (await client.count(collection, 'b', 'obj1')) == 2
+            assert (await client.count(collection, 'b')) == 5
+        await ingest.pool.destroy()
+        await rebuilt.pool.destroy()
+    journal.close()
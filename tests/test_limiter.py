@@ -0,0 +1,73 @@
+import asyncio
+from os import getenv
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel
+from asonic.limiter import AdaptiveLimiter, latency_above
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_aimd():
+    now = [0.0]
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=10, target_latency=0.1, clock=lambda: now[0])
+    for _ in range(4):
+        limiter.observe(0.01)
+    assert limiter.limit == pytest.approx(4.9, abs=0.1)
+    limiter.observe(0.2)
+    assert limiter.limit == pytest.approx(2.45, abs=0.05)
+    # the commands that were in flight during the congestion don't decrease it again
+    limiter.observe(0.2)
+    limiter.observe(0.01, error=True)
+    assert limiter.decreases == 1
+    now[0] = 1
+    limiter.observe(0.01, error=True)
+    assert limiter.decreases == 2
+    for _ in range(1000):
+        limiter.observe(0.01)
+    assert limiter.limit == 10
+
+
+async def test_learned_target():
+    limiter = AdaptiveLimiter(tolerance=2.0)
+    assert limiter.target() is None
+    limiter.observe(0.01)
+    assert limiter.target() == pytest.approx(0.02)
+    limiter.observe(0.05)
+    assert limiter.decreases == 1
+
+
+async def test_acquire():
+    limiter = AdaptiveLimiter(initial_limit=2)
+    await limiter.acquire()
+    await limiter.acquire()
+    waiting = [asyncio.ensure_future(limiter.acquire()) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert limiter.stats() == {'limit': 2, 'in_flight': 2, 'waiting': 2, 'decreases': 0}
+    waiting[0].cancel()
+    limiter.release(None)
+    await asyncio.sleep(0)
+    assert waiting[1].done() and limiter.in_flight == 2
+    limiter.release(None)
+    limiter.release(None)
+    assert limiter.in_flight == 0
+
+
+async def test_client_limiter():
+    limiter = AdaptiveLimiter(initial_limit=2, target_latency=1)
+    c = await Client.create(host=getenv('SONIC_HOST', 'localhost'), limiter=limiter)
+    assert (await asyncio.gather(*(c.ping() for _ in range(20)))) == [b'PONG'] * 20
+    # the limit grew from 2 as commands succeeded, connections were only opened up to it
+    assert 2 < c.pool._created_connections <= limiter.limit
+    assert limiter.in_flight == 0
+
+
+async def test_monitor():
+    control = await Client.create(host=getenv('SONIC_HOST', 'localhost'), channel=Channel.CONTROL)
+    limiter = AdaptiveLimiter(initial_limit=8)
+    limiter.monitor(control, latency_above(0.0001), interval=0.01)
+    await asyncio.sleep(0.1)
+    limiter.stop()
+    assert limiter.decreases > 0 and limiter.limit < 8
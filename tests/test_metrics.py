@@ -0,0 +1,44 @@
+import gc
+
+import pytest
+
+from asonic.connection import ConnectionPool
+from asonic.enums import Channel
+from asonic.metrics import Histogram, Metrics
+
+
+def test_histogram():
+    h = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        h.observe(value)
+    assert h.to_dict() == {'count': 4, 'sum': 2.65, 'buckets': {'0.1': 2, '1.0': 3, '+Inf': 4}}
+
+
+def test_prometheus():
+    metrics = Metrics(buckets=(0.1,))
+    metrics.observe_command('search', 'QUERY', 0.05)
+    metrics.observe_command('search', 'QUERY', 0.2, error=TimeoutError())
+    metrics.observe_pool_wait('search', 0.01)
+    metrics.bytes_written = 10
+    text = metrics.to_prometheus()
+    assert 'asonic_command_duration_seconds_bucket{channel="search",command="QUERY",le="0.1"} 1\n' in text
+    assert 'asonic_command_duration_seconds_count{channel="search",command="QUERY"} 2\n' in text
+    assert 'asonic_command_errors_total{channel="search",command="QUERY",error="TimeoutError"} 1\n' in text
+    assert 'asonic_pool_wait_seconds_count{channel="search"} 1\n' in text
+    assert 'asonic_written_bytes_total 10\n' in text
+    assert metrics.to_dict()['errors'] == {'search': {'QUERY': {'TimeoutError': 1}}}
+
+
+@pytest.mark.asyncio
+async def test_pools():
+    metrics = Metrics()
+    pool = ConnectionPool('localhost', 1491, Channel.SEARCH, 'SecretPassword', metrics=metrics)
+    assert set(metrics.pools) == {pool}
+    await pool.destroy()
+    assert len(metrics.pools) == 0
+
+    pool = ConnectionPool('localhost', 1491, Channel.SEARCH, 'SecretPassword', metrics=metrics)
+    del pool
+    gc.collect()
+    # a pool dropped without being destroyed is not kept alive
+    assert len(metrics.pools) == 0
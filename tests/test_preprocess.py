@@ -0,0 +1,51 @@
+from os import getenv
+from uuid import uuid4
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel
+from asonic.exceptions import ClientError
+from asonic.preprocess import Preprocessor
+
+collection = 'collection'
+
+
+def test_preprocess():
+    preprocessor = Preprocessor(strip_markup=True, dedupe=True, stopwords={'the'}, lowercase=True)
+    html = '<p>The <b>quick</b>&nbsp;brown fox</p><script>var fox = 1;</script><p>The QUICK fox!</p>'
+    assert preprocessor(html) == 'quick brown fox'
+    assert Preprocessor()('  ｆｕｌｌ width\n\ttext ') == 'full width text'
+    assert Preprocessor(max_bytes=12)('żółty lis i pies') == 'żółty lis'
+    assert Preprocessor(max_bytes=3)('abcdef') == 'abc'
+
+
+def test_preprocess_batch():
+    preprocessor = Preprocessor(strip_markup=True)
+    texts = ['<a href="x">one</a>', 'two < three', '<b>four\x00</b>', '']
+    assert preprocessor.process_many(texts) == ['one', 'two < three', 'four', '']
+    assert preprocessor.stats == {'texts': 4, 'bytes_in': 42, 'bytes_out': 18}
+    assert preprocessor.to_dict()['bytes_saved'] == 24
+
+
+@pytest.mark.asyncio
+async def test_preprocessed_push(search):
+    preprocessor = Preprocessor(strip_markup=True, dedupe=True)
+    ingest = await Client.create(host=getenv('SONIC_HOST', 'localhost'), channel=Channel.INGEST,
+                                 preprocessor=preprocessor)
+    bucket = str(uuid4())
+    assert (await ingest.push(collection, bucket, 'obj', '<p>fox fox fox</p>')) == b'OK'
+    with pytest.raises(ClientError):
+        await ingest.push(collection, bucket, 'empty', '<br/>')
+    records = [(collection, bucket, f'obj{i}', f'<i>dog</i> {i} dog') for i in range(5)]
+    results = {record: result async for record, result in ingest.push_many(records, concurrency=2)}
+    assert results == {(collection, bucket, f'obj{i}', f'dog {i}'): b'OK' for i in range(5)}
+    assert (await search.query(collection, bucket, 'fox')) == [b'obj']
+    assert len(await search.query(collection, bucket, 'dog')) == 5
+    assert preprocessor.stats['texts'] == 7
+
+    # malformed records fail alone
+    records = [(collection, bucket, 'obj'), (collection, bucket, 'bad', 42), (collection, bucket, 'ok', '<b>cat</b>')]
+    results = {record[2]: result async for record, result in ingest.push_many(records)}
+    assert isinstance(results['obj'], TypeError) and isinstance(results['bad'], Exception)
+    assert results['ok'] == b'OK'
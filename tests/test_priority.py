@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from asonic import Client
+from asonic.connection import PriorityScheduler, use_priority
+from asonic.enums import Command, Priority
+from asonic.testing import FakeSonic
+
+pytestmark = pytest.mark.asyncio
+collection = 'collection'
+
+
+async def grants(scheduler, waiting):
+    """
+    Queue `waiting` acquires while the only slot is held, then release slots one at a time and return the classes in
+    the order they got them
+    """
+    await scheduler.acquire(Priority.DEFAULT)
+    order = []
+
+    async def acquire(priority):
+        await scheduler.acquire(priority)
+        order.append(priority)
+
+    tasks = [asyncio.ensure_future(acquire(priority)) for priority in waiting]
+    await asyncio.sleep(0)
+    scheduler.release(Priority.DEFAULT)
+    for _ in waiting:
+        await asyncio.sleep(0)
+        scheduler.release(order[-1])
+    await asyncio.gather(*tasks)
+    return order
+
+
+async def test_weighted_fair():
+    scheduler = PriorityScheduler(1, weights={Priority.INTERACTIVE: 2})
+    order = await grants(scheduler, [Priority.BULK] * 3 + [Priority.INTERACTIVE] * 4)
+    i, b = Priority.INTERACTIVE, Priority.BULK
+    assert order == [i, b, i, i, b, i, b]
+    assert scheduler.stats()['bulk'] == {'held': 0, 'waiting': 0, 'granted': 3}
+
+    # with the default weights, interactive commands go first and bulk commands still get through
+    order = await grants(PriorityScheduler(1), [Priority.BULK] * 2 + [Priority.INTERACTIVE] * 20)
+    assert order[0] == Priority.INTERACTIVE
+    assert order.index(Priority.BULK) < 20
+
+
+async def test_caps_and_cancel():
+    scheduler = PriorityScheduler(3, caps={Priority.BULK: 1})
+    await scheduler.acquire(Priority.BULK)
+    bulk = asyncio.ensure_future(scheduler.acquire(Priority.BULK))
+    await asyncio.sleep(0)
+    # capped, even though slots are free
+    assert not bulk.done()
+    await scheduler.acquire(Priority.DEFAULT)
+    bulk.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.stats()['bulk'] == {'held': 1, 'waiting': 0, 'granted': 1}
+    scheduler.release(Priority.BULK)
+    scheduler.release(Priority.DEFAULT)
+    assert scheduler.slots == 3
+
+
+async def test_client_priorities():
+    latency = {Command.LIST: 0.02}
+    async with FakeSonic(port=0, latency=lambda command: latency.get(command, 0)) as server:
+        c = await Client.create(
+            host=server.host, port=server.port, max_connections=1, priorities={Command.LIST: Priority.BULK}
+        )
+        finished = []
+
+        async def run(name, call):
+            await call
+            finished.append(name)
+
+        lists = [asyncio.ensure_future(run('list', c.list(collection, 'b'))) for _ in range(5)]
+        await asyncio.sleep(0.005)
+        await run('query', c.query(collection, 'b', 'fox'))
+        # the query took the connection freed by the first list
+        assert finished == ['list', 'query']
+
+        with use_priority(Priority.INTERACTIVE):
+            lists += [asyncio.ensure_future(run('interactive list', c.list(collection, 'b')))]
+        await asyncio.gather(*lists)
+        # right after the list holding the connection
+        assert finished[2:4] == ['list', 'interactive list']
+        assert c.pool.scheduler.stats()['interactive']['granted'] == 1
+        await c.pool.destroy()
@@ -0,0 +1,71 @@
+import asyncio
+from os import getenv
+from uuid import uuid4
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel
+from asonic.protocol import ProtocolConnection, SonicProtocol
+from asonic.testing import FakeSonic
+
+pytestmark = pytest.mark.asyncio
+collection = 'collection'
+
+
+async def test_framing():
+    connection = ProtocolConnection('localhost', 1491, Channel.SEARCH, 'SecretPassword')
+    protocol = SonicProtocol(connection)
+    for data in (b'CONNECTED <sonic-server v1.2.3>\r\nSTARTED search pro', b'tocol(1) buffer(20000)\r', b'\n', b'PO'):
+        protocol.data_received(data)
+    assert (await connection.read()) == b'CONNECTED <sonic-server v1.2.3>'
+    assert (await connection.read()) == b'STARTED search protocol(1) buffer(20000)'
+    read = asyncio.ensure_future(connection.read())
+    await asyncio.sleep(0)
+    protocol.data_received(b'NG\r\n')
+    assert (await read) == b'PONG'
+
+
+@pytest.mark.parametrize('transport', ['stream', 'protocol'])
+async def test_multiplexed_backpressure(transport):
+    async with FakeSonic(port=0) as server:
+        search = await Client.create(port=server.port, transport=transport, multiplex=True, max_connections=1)
+        connection = await search.pool.get_shared_connection()
+        # the transport buffer is full until the server reads
+        if transport == 'stream':
+            connection.writer.transport.get_write_buffer_size = lambda: 1 << 30
+            connection.writer._protocol.pause_writing()
+        else:
+            connection.pause_writing()
+        queries = [asyncio.ensure_future(search.query(collection, 'b', 'fox')) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        assert not any(query.done() for query in queries)
+        assert connection.in_flight == 0
+        if transport == 'stream':
+            del connection.writer.transport.get_write_buffer_size
+            connection.writer._protocol.resume_writing()
+        else:
+            connection.resume_writing()
+        assert (await asyncio.gather(*queries)) == [[]] * 5
+        await search.pool.destroy()
+
+
+async def test_protocol_transport():
+    host = getenv('SONIC_HOST', 'localhost')
+    ingest = await Client.create(host=host, channel=Channel.INGEST, transport='protocol')
+    search = await Client.create(host=host, transport='protocol', multiplex=True, max_connections=1)
+    bucket = str(uuid4())
+    assert (await ingest.push(collection, bucket, 'obj', 'The quick brown fox')) == b'OK'
+    assert (await ingest.count(collection, bucket)) == 3
+    results = await asyncio.gather(*(search.query(collection, bucket, 'fox') for _ in range(20)))
+    assert results == [[b'obj']] * 20
+    assert (await search.suggest(collection, bucket, 'qui')) == [b'quick']
+
+
+async def test_protocol_broken_connection():
+    c = await Client.create(host=getenv('SONIC_HOST', 'localhost'), max_connections=1, transport='protocol')
+    connection = await c.pool.get_connection()
+    connection.transport.close()
+    await c.pool.release(connection)
+    assert (await c.ping()) == b'PONG'
+    assert c.pool._created_connections == 1
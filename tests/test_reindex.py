@@ -0,0 +1,63 @@
+from os import getenv
+from uuid import uuid4
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel
+from asonic.reindex import DbmStore, MemoryStore, Reindexer, SqliteStore, Store
+
+pytestmark = pytest.mark.asyncio
+collection = 'collection'
+
+
+@pytest.mark.parametrize('make_store', [
+    lambda path: MemoryStore(),
+    lambda path: DbmStore(str(path / 'index.dbm')),
+    lambda path: SqliteStore(str(path / 'index.sqlite')),
+])
+async def test_store(tmp_path, make_store):
+    store = make_store(tmp_path)
+    key = (collection, 'bucket', 'obj')
+    assert store.get(key) is None
+    store.set(key, ('digest', frozenset({'quick', 'fox'})))
+    assert store.get(key) == ('digest', frozenset({'quick', 'fox'}))
+    store.delete(key)
+    store.delete(key)
+    assert store.get(key) is None
+    store.close()
+
+
+async def test_incomplete_store():
+    class GetOnly(Store):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+async def test_reindex(search, tmp_path):
+    host = getenv('SONIC_HOST', 'localhost')
+    ingest = await Client.create(host=host, channel=Channel.INGEST)
+    reindexer = Reindexer(ingest, SqliteStore(str(tmp_path / 'index.sqlite')))
+    bucket = str(uuid4())
+    assert (await reindexer.sync(collection, bucket, 'obj', 'The quick brown fox')) == 'pushed'
+    assert (await reindexer.sync(collection, bucket, 'obj', 'The quick brown fox')) == 'unchanged'
+    assert (await reindexer.sync(collection, bucket, 'obj', 'The quick red fox')) == 'updated'
+    assert (await search.query(collection, bucket, 'red')) == [b'obj']
+    assert (await search.query(collection, bucket, 'brown')) == []
+    assert (await search.query(collection, bucket, 'quick fox')) == [b'obj']
+    assert reindexer.stats == {
+        'unchanged': 1, 'pushed': 1, 'updated': 1, 'words_pushed': 5, 'words_popped': 1, 'removed': 0
+    }
+    reindexer.store.close()
+
+    # the store survives restarts
+    reindexer = Reindexer(ingest, SqliteStore(str(tmp_path / 'index.sqlite')))
+    records = [(collection, bucket, 'obj', 'The quick red fox'), (collection, bucket, 'other', 'A lazy dog')]
+    outcomes = {record[2]: result async for record, result in reindexer.sync_many(records)}
+    assert outcomes == {'obj': 'unchanged', 'other': 'pushed'}
+    assert (await reindexer.remove(collection, bucket, 'other')) == 2
+    assert (await search.query(collection, bucket, 'dog')) == []
+    reindexer.store.close()
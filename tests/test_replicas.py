@@ -0,0 +1,67 @@
+import asyncio
+from time import monotonic
+from uuid import uuid4
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel, Command
+from asonic.replicas import ReplicaClient
+from asonic.testing import FakeSonic
+
+pytestmark = pytest.mark.asyncio
+collection = 'collection'
+
+
+async def replicas(latencies, **kwargs):
+    servers = [await FakeSonic(port=0, latency=latency).start() for latency in latencies]
+    bucket = str(uuid4())
+    for server in servers:
+        ingest = await Client.create(host=server.host, port=server.port, channel=Channel.INGEST)
+        await ingest.push(collection, bucket, 'obj', 'The quick brown fox')
+        await ingest.pool.destroy()
+    client = await ReplicaClient.create([(server.host, server.port) for server in servers], **kwargs)
+    return servers, client, bucket
+
+
+async def close(servers, client):
+    for replica in client.replicas:
+        await replica.client.pool.destroy()
+    for server in servers:
+        await server.close()
+
+
+async def test_least_outstanding():
+    servers, client, bucket = await replicas([0.05, 0.05])
+    results = await asyncio.gather(*(client.query(collection, bucket, 'fox') for _ in range(20)))
+    assert results == [[b'obj']] * 20
+    assert [server.commands['QUERY'] for server in servers] == [10, 10]
+    assert all(replica['outstanding'] == 0 for replica in client.stats()['replicas'].values())
+    await close(servers, client)
+
+
+async def test_latency_strategy():
+    servers, client, bucket = await replicas([0.0, 0.05], strategy='latency', window=50, decay=0.5)
+    assert client.latencies.maxlen == 50
+    assert all(replica.decay == 0.5 for replica in client.replicas)
+    for _ in range(20):
+        await client.query(collection, bucket, 'fox')
+    # the slow replica is only tried until it was measured
+    assert servers[1].commands.get('QUERY', 0) <= 2
+    await close(servers, client)
+
+
+async def test_hedged_request():
+    def slow(command):
+        return 1.0 if command == Command.QUERY else 0.0
+
+    servers, client, bucket = await replicas([slow, 0.0], hedge_percentile=0.9, hedge_min_samples=5, multiplex=True)
+    client.latencies.extend([0.01] * 5)
+    start = monotonic()
+    for _ in range(10):
+        assert (await client.query(collection, bucket, 'fox')) == [b'obj']
+    assert monotonic() - start < 1.0
+    assert client.hedged == client.hedge_wins == servers[0].commands['QUERY']
+    await asyncio.sleep(0.01)  # cancelled commands are accounted once their task is done
+    assert client.stats()['replicas'][f'{servers[0].host}:{servers[0].port}']['outstanding'] == 0
+    await close(servers, client)
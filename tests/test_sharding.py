@@ -0,0 +1,51 @@
+from itertools import chain
+from uuid import uuid4
+
+import pytest
+
+from asonic.enums import Channel
+from asonic.sharding import HashRing, ShardedClient, merge
+from asonic.testing import FakeSonic
+
+collection = 'collection'
+
+
+def test_ring_moves_few_keys():
+    keys = [f'{collection}:{uuid4()}' for _ in range(10000)]
+    ring = HashRing(['node1', 'node2', 'node3', 'node4'])
+    before = {key: ring.get(key) for key in keys}
+    assert min(list(before.values()).count(node) for node in ring.nodes) > 1500
+    ring.add('node5')
+    moved = [key for key in keys if ring.get(key) != before[key]]
+    assert all(ring.get(key) == 'node5' for key in moved)
+    assert 1000 < len(moved) < 3000
+
+
+def test_merge():
+    assert merge([[b'a', b'b', b'c'], [b'd', b'a'], []]) == [b'a', b'd', b'b', b'c']
+    assert merge([[b'a', b'b', b'c'], [b'd', b'a']], limit=2, offset=1) == [b'd', b'b']
+
+
+@pytest.mark.asyncio
+async def test_sharded_client():
+    servers = [await FakeSonic(port=0).start() for _ in range(3)]
+    nodes = [f'{server.host}:{server.port}' for server in servers]
+    ingest = await ShardedClient.create(nodes, channel=Channel.INGEST)
+    search = await ShardedClient.create(nodes, channel=Channel.SEARCH)
+    buckets = [str(uuid4()) for _ in range(30)]
+    for bucket in buckets:
+        assert (await ingest.push(collection, bucket, 'obj', 'The quick brown fox')) == b'OK'
+    assert all(server.commands.get('PUSH', 0) > 0 for server in servers)
+    assert sum(server.commands['PUSH'] for server in servers) == 30
+    assert (await search.query(collection, buckets[0], 'fox')) == [b'obj']
+    assert (await ingest.count(collection)) == 30
+    assert (await ingest.count(collection, buckets[0], 'obj')) == 3
+
+    by_word = ShardedClient(search.clients, key=lambda collection, bucket: None)
+    assert (await by_word.query(collection, buckets[0], 'fox')) == [b'obj']
+    assert (await by_word.list(collection, buckets[0])) == [b'brown', b'fox', b'quick']
+    assert (await ingest.flushc(collection)) == 3
+    for client in chain(ingest.clients.values(), search.clients.values()):
+        await client.pool.destroy()
+    for server in servers:
+        await server.close()
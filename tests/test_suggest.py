@@ -0,0 +1,113 @@
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel
+from asonic.suggest import SuggestCache
+from asonic.testing import FakeSonic
+
+collection = 'collection'
+
+
+def test_narrowing():
+    cache = SuggestCache()
+    cache.set(collection, 'b', 'co', 5, [b'comma', b'commit', b'code'], cache.generation())
+    # complete result: every word starting with "co" is known
+    assert cache.get(collection, 'b', 'co', 5) == [b'comma', b'commit', b'code']
+    assert cache.get(collection, 'b', 'com', 5) == [b'comma', b'commit']
+    assert cache.get(collection, 'b', 'COMMI', 5) == [b'commit']
+    assert cache.get(collection, 'b', 'cox', 5) == []
+    assert cache.get(collection, 'b', 'c', 5) is None
+    assert cache.get(collection, 'other', 'com', 5) is None
+    # not cached for other result types
+    assert cache.get(collection, 'b', 'co', 5, 'str') is None
+    assert cache.stats() == {
+        'size': 1, 'hits': 1, 'local_hits': 3, 'misses': 3, 'evictions': 0, 'invalidations': 0
+    }
+
+    cache.set(collection, 'b', 'żó', 5, ['Żółty'.encode(), 'żółw'.encode(), b'zoo'], cache.generation())
+    assert cache.get(collection, 'b', 'ŻÓŁ', 5) == ['Żółty'.encode(), 'żółw'.encode()]
+
+
+def test_truncated():
+    cache = SuggestCache()
+    cache.set(collection, 'b', 'co', 2, ['comma', 'commit'], cache.generation())
+    # there may be more words, only the same prefix with a lower limit is known
+    assert cache.get(collection, 'b', 'co', 1) == ['comma']
+    assert cache.get(collection, 'b', 'co', 2) == ['comma', 'commit']
+    assert cache.get(collection, 'b', 'co', 3) is None
+    assert cache.get(collection, 'b', 'com', 2) is None
+
+    # a complete result of the whole bucket (LIST) answers every prefix
+    cache.set(collection, 'b', '', 100, ['code', 'comma', 'commit', 'comet'], cache.generation())
+    assert cache.get(collection, 'b', 'com', 2) == ['comma', 'commit']
+    # the deepest usable result is preferred
+    assert cache.get(collection, 'b', 'co', 2) == ['comma', 'commit']
+    assert cache.hits == 3
+
+
+def test_ttl():
+    now = [0.0]
+    cache = SuggestCache(ttl=10, clock=lambda: now[0])
+    cache.set(collection, 'b', 'qu', 5, [b'quick'], cache.generation())
+    assert cache.get(collection, 'b', 'qui', 5) == [b'quick']
+    now[0] = 10
+    assert cache.get(collection, 'b', 'qui', 5) is None
+
+
+def test_lru():
+    cache = SuggestCache(max_size=2)
+    cache.set(collection, 'b', 'abc', 5, [b'abcd'], cache.generation())
+    cache.set(collection, 'b', 'ab', 5, [b'abcd'], cache.generation())
+    assert cache.get(collection, 'b', 'abc', 5) == [b'abcd']
+    cache.set(collection, 'b', 'x', 5, [b'xyz'], cache.generation())
+    assert cache.evictions == 1
+    assert cache.get(collection, 'b', 'ab', 5) is None
+    assert cache.get(collection, 'b', 'abc', 5) == [b'abcd']
+
+    cache.set(collection, 'b', 'y', 5, [b'yes'], cache.generation())
+    cache.set(collection, 'b', 'z', 5, [b'zoo'], cache.generation())
+    # the evicted branches are pruned from the trie
+    assert set(cache._tries[(collection, 'b', 'bytes')].children) == {'y', 'z'}
+
+
+def test_invalidate():
+    cache = SuggestCache()
+    for bucket in ('b1', 'b2'):
+        cache.set(collection, bucket, 'qu', 5, [b'quick'], cache.generation())
+    cache.invalidate(collection, 'b1')
+    assert cache.get(collection, 'b1', 'qu', 5) is None
+    assert cache.get(collection, 'b2', 'qu', 5) == [b'quick']
+
+    generation = cache.generation()
+    cache.invalidate(collection, 'b2')
+    # fetched before the invalidation, must not be stored
+    cache.set(collection, 'b2', 'qu', 5, [b'stale'], generation)
+    cache.set(collection, 'b1', 'qu', 5, [b'quick'], generation)
+    assert cache.get(collection, 'b2', 'qu', 5) is None
+    assert cache.get(collection, 'b1', 'qu', 5) == [b'quick']
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_client_suggest_cache():
+    cache = SuggestCache()
+    async with FakeSonic(port=0) as server:
+        search = await Client.create(host=server.host, port=server.port, suggest_cache=cache)
+        ingest = await Client.create(host=server.host, port=server.port, channel=Channel.INGEST, suggest_cache=cache)
+        await ingest.push(collection, 'b', 'obj', 'The quick brown fox quietly quits')
+        assert (await search.suggest(collection, 'b', 'q', limit=5)) == [b'quick', b'quietly', b'quits']
+        for prefix, words in (('qu', [b'quick', b'quietly', b'quits']), ('qui', [b'quick', b'quietly', b'quits']),
+                              ('quie', [b'quietly'])):
+            assert (await search.suggest(collection, 'b', prefix, limit=5)) == words
+        assert server.commands['SUGGEST'] == 1
+
+        await ingest.push(collection, 'b', 'obj2', 'quiet')
+        assert (await search.suggest(collection, 'b', 'quie', limit=5)) == [b'quiet', b'quietly']
+        assert server.commands['SUGGEST'] == 2
+
+        assert len(await search.list(collection, 'b', limit=100)) == 6
+        assert (await search.suggest(collection, 'b', 'br', limit=5)) == [b'brown']
+        assert server.commands['SUGGEST'] == 2
+        await search.pool.destroy()
+        await ingest.pool.destroy()
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Channel, Command
+from asonic.exceptions import ConnectionClosed, ServerError
+from asonic.testing import FakeSonic
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_buffer():
+    async with FakeSonic(port=0, buffer=1000) as server:
+        c = await Client.create(port=server.port, channel=Channel.INGEST)
+        assert c.pool.buffer == 1000
+        assert (await c.push('collection', 'bucket', 'obj', 'word ' * 1000)) == b'OK'
+        assert server.commands['PUSH'] == 6
+        assert (await c.count('collection', 'bucket', 'obj')) == 1
+
+
+async def test_injected_failures():
+    async with FakeSonic(port=0, error_rate=1) as server:
+        c = Client(port=server.port)
+        with pytest.raises(ServerError):
+            await c.channel(Channel.SEARCH)
+    async with FakeSonic(port=0) as server:
+        c = await Client.create(port=server.port)
+        server.disconnect_rate = 1
+        with pytest.raises(ConnectionClosed):
+            await c.ping()
+
+
+async def test_latency():
+    latency = {Command.QUERY: 0.2}
+    async with FakeSonic(port=0, latency=lambda command: latency.get(command, 0)) as server:
+        c = await Client.create(port=server.port, multiplex=True, max_connections=1)
+        query = asyncio.ensure_future(c.query('collection', 'bucket', 'slow'))
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        assert (await c.suggest('collection', 'bucket', 'fast')) == []
+        assert time.monotonic() - start < 0.1
+        assert not query.done()
+        assert (await query) == []
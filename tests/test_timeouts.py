@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from asonic import Client
+from asonic.enums import Command
+from asonic.exceptions import Timeout
+from asonic.testing import FakeSonic
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_command_timeout():
+    latency = {Command.QUERY: 0.0}
+    async with FakeSonic(port=0, latency=lambda command: latency.get(command, 0)) as server:
+        c = await Client.create(port=server.port, max_connections=1, command_timeout=0.1)
+        latency[Command.QUERY] = 1
+        with pytest.raises(Timeout):
+            await c.query('collection', 'bucket', 'slow')
+        # the stuck connection was replaced
+        assert c.pool._created_connections == 0
+        assert (await c.ping()) == b'PONG'
+        assert (await c.query('collection', 'bucket', 'slow', timeout=2)) == []
+
+
+async def test_multiplexed_command_timeout():
+    latency = {Command.QUERY: 0.0}
+    async with FakeSonic(port=0, latency=lambda command: latency.get(command, 0)) as server:
+        c = await Client.create(port=server.port, max_connections=1, multiplex=True)
+        latency[Command.QUERY] = 0.2
+        connection = c.pool._shared_connections[0]
+        others = [asyncio.ensure_future(c.query('collection', 'bucket', 'slow')) for _ in range(5)]
+        with pytest.raises(Timeout):
+            await c.query('collection', 'bucket', 'slow', timeout=0.05)
+        # only the caller gave up, the commands sharing the connection still get their reply
+        assert (await asyncio.gather(*others)) == [[]] * 5
+        assert not connection.closed
+        assert (await c.ping()) == b'PONG'
+
+        # no reply at all: the connection is stuck, it is closed and replaced
+        latency[Command.PING] = 1
+        with pytest.raises(Timeout):
+            await c.ping(timeout=0.1)
+        assert connection.closed
+        latency[Command.PING] = 0
+        assert (await c.ping()) == b'PONG'
+        assert c.pool._shared_connections[0] is not connection
+
+
+async def test_abandoned_commands():
+    async with FakeSonic(port=0, latency=lambda command: 10 if command == Command.QUERY else 0) as server:
+        c = await Client.create(port=server.port, max_connections=2, max_in_flight=1, multiplex=True)
+        connection = c.pool._shared_connections[0]
+        for _ in range(3):
+            with pytest.raises(Timeout):
+                await c.query('collection', 'bucket', 'slow', timeout=0.05)
+        # the EVENTs never came, the connection is still the least busy one
+        assert connection.in_flight == 0
+        assert (await c.pool.get_shared_connection()) is connection
+        assert c.pool._created_connections == 1
+
+        # cancelled before its reply was read
+        query = asyncio.ensure_future(c.query('collection', 'bucket', 'slow'))
+        await asyncio.sleep(0)
+        query.cancel()
+        await asyncio.sleep(0)
+        assert connection.in_flight == 0
+        assert (await c.ping()) == b'PONG'
+        assert c.pool._created_connections == 1
+        await c.pool.destroy()
+
+
+async def test_pool_timeout():
+    async with FakeSonic(port=0) as server:
+        c = await Client.create(port=server.port, max_connections=1, pool_timeout=0.1)
+        connection = await c.pool.get_connection()
+        with pytest.raises(Timeout):
+            await c.ping()
+        await c.pool.release(connection)
+        assert (await c.ping()) == b'PONG'
+
+
+async def test_connect_timeout():
+    async def silent(reader, writer):
+        await reader.read()
+
+    server = await asyncio.start_server(silent, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    with pytest.raises(Timeout):
+        await Client.create(port=port, connect_timeout=0.1)
+    server.close()
+    await server.wait_closed()